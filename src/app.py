@@ -1,12 +1,26 @@
 import os
+import locale
+import queue
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import modules.list_managers as listm
 import modules.dialogs as dialogs
 import modules.db as db
-from modules.crypting import Crypting
+import modules.importer as importer
+from modules.crypting import Crypting, cached_crypting
+from modules.entries import decrypt_entries
 
 
+# Delay (ms) after the last keystroke before the search field is applied to the list
+SEARCH_DELAY = 250
+
+# Interval (ms) at which the result queue of a background task is polled
+TASK_POLL = 50
+
+# Names and keys of a loaded database are decrypted in the background this many keys at a time
+FILL_BATCH = 2000
+
 class Manager(tk.Tk):
     """
     Simple password manager
@@ -16,12 +30,25 @@ class Manager(tk.Tk):
         self.title("Password Manager")
         self.option_add("*tearOff",value=False)
         self.geometry("620x520")
+        self.protocol("WM_DELETE_WINDOW",self.quit_app)
 
         self.unsaved = False
+        self.busy = False
+        self.task_results = queue.Queue()
+        self.task_failed = None
+        self.task_error = None
+        self.fill_stop = None
 
         self.search_param = tk.StringVar(self,value="")
         self.search_param.trace_add(mode="write",callback=self.search_param_callback) 
+        self.search_job = None
+        self.last_search = ""
         self.show_data = []
+        self.sort_field = None
+        self.sort_reverse = False
+        # All keys of self.data in the sort order, kept between searches (see listed_keys)
+        self.sorted_keys = None
+        self.sorted_data = None
         self.unsaved_var = tk.StringVar(self,value=" "*18)
         self.db_path_var = tk.StringVar(self,value="No Database Loaded")
         self.username = ""
@@ -54,6 +81,8 @@ class Manager(tk.Tk):
         data_menu.add_command(label="Backup Database",command=self.backup_data)
         data_menu.add_command(label="Change database password",command=self.change_password)
         data_menu.add_command(label="Redefine Database",command=self.redefine_database)
+        data_menu.add_command(label="Convert Database File",command=self.convert_data)
+        data_menu.add_command(label="Import Keys",command=self.import_keys)
 
         help_menu.add_command(label="About",command=self.display_info)
 
@@ -90,8 +119,8 @@ class Manager(tk.Tk):
         self.user_active.grid(row = 0,column=7)
 
 
-        # Create main dataframe
-        self.mainframe = listm.ScrollableFrame(self)
+        # Create main dataframe, only the visible rows are made into widgets
+        self.mainframe = listm.VirtualList(self,make_row=self.make_row,headers=self.make_headers)
         self.mainframe.pack(side="top",fill="both", expand=True,padx=10)
 
 
@@ -102,8 +131,19 @@ class Manager(tk.Tk):
         self.db_info = tk.Label(self.bottombar,textvariable=self.db_path_var,justify="left")
         self.db_info.pack(side="left")
 
+        # Shown while a background task runs
+        self.task_var = tk.StringVar(self,value="")
+        self.progress = ttk.Progressbar(self.bottombar,mode="indeterminate",length=120)
+        self.task_info = tk.Label(self.bottombar,textvariable=self.task_var)
+
 
     # Checks for user actions
+    def check_idle(self):
+        if self.busy:
+            messagebox.showinfo(title="Please wait",message="{}\nTry again when it has finished.".format(self.task_var.get()))
+            return False
+        return True
+
     def check_login_ok(self):
         if not self.username:
             messagebox.showinfo(title="Not yet logged in",message="You must first log in.")
@@ -129,7 +169,7 @@ class Manager(tk.Tk):
 
     # Create new database
     def create_data(self):
-        if not self.check_login_ok() or not self.check_unsaved_ok():
+        if not self.check_idle() or not self.check_login_ok() or not self.check_unsaved_ok():
             return
 
         result = db.create_data(self,self.password,placeholder=False)
@@ -142,49 +182,146 @@ class Manager(tk.Tk):
 
     # Load database
     def load_data(self):
-        if not self.check_login_ok() or not self.check_unsaved_ok():
+        if not self.check_idle() or not self.check_login_ok() or not self.check_unsaved_ok():
             return
 
-        result = db.load_data(self, self.password)
+        database_path = db.ask_load_path(self, self.password)
 
-        if not result:
+        if not database_path:
             return
 
-        self.data, self.path = result
-
-        self.unsaved = False
-        self.update_list()
+        self.start_load(database_path)
+
+    def start_load(self,database_path,login=False):
+        """
+        Read database in the background. The list is shown from the first batch of keys on
+        and grows as the rest are read, names and keys are decrypted after that.
+        A wrong password is noticed from the header before any key is read, on login the user is then logged out.
+        When reading fails, the database shown before is restored, the keys read so far are never saved.
+        """
+        password = self.password
+        previous = (self.data,self.path,self.unsaved)
+
+        def load(report):
+            data, path = db.open_data(password,database_path,progressive=True)
+            report((data,[]))
+            for batch in data.batches:
+                report((data,batch))
+            return data
+
+        def add_batch(result):
+            data, batch = result
+            if data is not self.data:
+                self.stop_fill()
+                self.data, self.path = data, database_path
+                self.unsaved = False
+                self.update_list()
+            data.add_batch(batch)
+            self.sorted_keys = None
+            # Keys are shown in database order while loading, sorting is applied when all are in
+            self.show_data.extend(item for item in batch if self.matches_search(item))
+            self.mainframe.set_items(self.show_data)
+
+        def loaded(data):
+            data.end_read(database_path)
+            self.sorted_keys = None
+            self.update_list()
+            self.start_fill(data)
+
+        def failed(error):
+            if self.data is not previous[0]:
+                self.stop_fill()
+                self.data, self.path, self.unsaved = previous
+                self.update_list()
+                self.start_fill(self.data)
+            if not isinstance(error,db.WrongPasswordError):
+                messagebox.showerror(title="Operation failed",message="Loading database...\n{}".format(error))
+                return
+            messagebox.showwarning(title="Wrong password",message="Password does not open database {}.\nPlease try again.".format(database_path))
+            if login:
+                self.username = ""
+                self.password = ""
+                self.update_user()
+
+        self.run_task("Loading database...",load,loaded,progress=add_batch,failed=failed)
+
+    def start_fill(self,data):
+        """
+        Decrypt names and keys of all keys on a worker thread, FILL_BATCH keys at a time.
+        Rows decrypt their own key when shown, this only saves the wait when sorting by name or copying keys.
+        """
+        self.stop_fill()
+        stop = self.fill_stop = threading.Event()
+        entries = list(data.keys)
+
+        def fill():
+            for n in range(0,len(entries),FILL_BATCH):
+                if stop.is_set():
+                    return
+                decrypt_entries(entries[n:n+FILL_BATCH])
+
+        threading.Thread(target=fill,daemon=True).start()
+
+    def stop_fill(self):
+        if self.fill_stop is not None:
+            self.fill_stop.set()
+            self.fill_stop = None
 
     # Save database
     def save_data(self):
-        if not self.check_login_ok() or not self.check_data_ok():
-            return
-
-        if not self.path:
-            database_path =  None
-        else:
-            database_path = self.path
-
-        result = db.save_data(self.data,self.password,database_path)
-
-        if not result:
+        if not self.check_idle() or not self.check_login_ok() or not self.check_data_ok():
             return
-        self.data, self.path = result
 
-        self.unsaved = False
-        self.update_save_state()
-        self.update_list()
+        self.start_save(self.password)
+
+    def start_save(self,password,backup_password=None,path=None,params=None):
+        """
+        Save database in the background with given password.
+        args:
+            backup_password : str   Make a backup with this password before saving, None for no backup
+            path : str              Path to save to, defaults to the current one
+            params : tuple          New (pass_pad, data_pad, mode) of the database, set after the backup is made
+        """
+        if not self.path and not path:
+            path = db.ask_save_path()
+            if not path:
+                return
+        database_path = path or self.path
+        backup_path = None
+        if backup_password is not None:
+            backup_path = db.get_backup_filepath(self.path,self.username)
+        data = self.data
+
+        def save():
+            if backup_path:
+                db.backup_data(data,backup_password,backup_path)
+            if params:
+                data.char1, data.char2, data.mode = params
+            return db.save_data(data,password,database_path)
+
+        def saved(result):
+            self.data, self.path = result
+            self.password = password
+            self.unsaved = False
+            self.update_save_state()
+            self.update_db_info()
+
+        self.run_task("Saving database...",save,saved)
 
 
     # Back-up database
     def backup_data(self):
-        if not self.check_login_ok() or not self.check_data_ok():
+        if not self.check_idle() or not self.check_login_ok() or not self.check_data_ok():
+            return
+        backup_path = db.ask_backup_path()
+        if not backup_path:
             return
-        db.backup_data(self.data,self.password)
+        data, password = self.data, self.password
+        self.run_task("Saving backup...",lambda: db.backup_data(data,password,backup_path))
 
     # Change database password
     def change_password(self):
-        if not self.check_login_ok() or not self.check_data_ok():
+        if not self.check_idle() or not self.check_login_ok() or not self.check_data_ok():
             return
 
         result = dialogs.ask_change_password(self,self.password,self.data)
@@ -192,20 +329,71 @@ class Manager(tk.Tk):
         if not result:
             return
 
-        #Backup database, just in case
-        backup_path = db.get_backup_filepath(self.path,self.username)
-        db.backup_data(self.data,self.password,backup_path)
-
         # Get new values
         _,new_pw,_ = result
 
-        self.password = new_pw
+        #Backup database, just in case
+        self.start_save(new_pw,backup_password=self.password)
+
+    # Convert database file between JSON and binary format
+    def convert_data(self):
+        # Source may be the database a background save is still writing
+        if not self.check_idle():
+            return
+        result = db.convert_data()
+
+        if not result:
+            return
+        messagebox.showinfo(title="Database converted",message="Database was saved to {}".format(result))
+
+    # Import keys from CSV / JSON exports of other password managers
+    def import_keys(self):
+        """
+        Rows are read and checked on a worker thread and added batch by batch without dialogs,
+        the keys are encrypted when the database is saved.
+        """
+        if not self.check_idle() or not self.check_login_ok() or not self.check_data_ok():
+            return
+
+        import_path = filedialog.askopenfilename(filetypes=importer.IMPORT_FILES)
+        if not import_path:
+            return
+        overwrite = messagebox.askyesnocancel(title="Import keys",
+                                              message="Overwrite existing keys with the same target as an imported key?\nChoose No to keep the existing keys.",
+                                              icon="question")
+        if overwrite is None:
+            return
+        policy = "overwrite" if overwrite else "skip"
+
+        data = self.data
+        data_pad = data.char2
+        totals = [0,[]]
 
-        self.save_data()
+        def read(report):
+            for batch in importer.read_import(import_path,data_pad):
+                report(batch)
+            return import_path
+
+        def add_batch(batch):
+            importer.add_batch(data,batch,policy,totals)
+            self.sorted_keys = None
+
+        def imported(result):
+            added, rejected = totals
+            if added:
+                self.unsaved = True
+            self.update_list()
+            message = "{} keys imported from {}.".format(added,import_path)
+            if rejected:
+                rows = ", ".join(str(number) for number,_ in rejected[:10])
+                message += "\n{} rows were skipped (rows {}{}).\nRow {}: {}".format(len(rejected),rows,", ..." if len(rejected) > 10 else "",rejected[0][0],rejected[0][1])
+            messagebox.showinfo(title="Keys imported",message=message)
+
+        self.run_task("Importing keys...",read,imported,progress=add_batch)
 
     # Define (or redefine) database parameters
     def redefine_database(self):
-        if not self.check_login_ok() or not self.check_data_ok():
+        if not self.check_idle() or not self.check_login_ok() or not self.check_data_ok():
             return
 
         result = dialogs.ask_define_database(self,self.password,self.data,self.path,redefine=True)
@@ -213,25 +401,17 @@ class Manager(tk.Tk):
         if not result:
             return
 
-        #Backup database, just in case
-        backup_path = db.get_backup_filepath(self.path,self.username)
-        db.backup_data(self.data,self.password,backup_path)
-
         # Get new values
         _, new_pw, _, change_password, pass_pad, data_pad, mode_int, database_path = result
 
-        if change_password == 1:
-            self.password = new_pw
-        self.data.char1 = pass_pad
-        self.data.char2 = data_pad
-        self.data.mode = mode_int
-        self.path = database_path
+        password = new_pw if change_password == 1 else self.password
 
-        self.save_data()
+        #Backup database, just in case
+        self.start_save(password,backup_password=self.password,path=database_path,params=(pass_pad,data_pad,mode_int))
 
     # Login user
     def login(self):
-        if not self.check_unsaved_ok():
+        if not self.check_idle() or not self.check_unsaved_ok():
             return
 
         response = dialogs.user_credentials(self)
@@ -244,27 +424,31 @@ class Manager(tk.Tk):
         if not self.username:
             return
 
+        database_path = None
         if load == 1:
-            result = db.load_data(self,self.password,default=True,username=self.username)
-            if not result:
-                result = db.create_data(self,self.password,placeholder = True)
-        else:
-            result = db.create_data(self,self.password,placeholder = True)
+            database_path = db.ask_load_path(self,self.password,default=True,username=self.username)
 
         self.update_user()
 
-        self.data, self.path = result
+        # Previous user's keys are cleared right away, the database is loaded in the background
+        self.data, self.path = db.create_data(self,self.password,placeholder = True)
         self.unsaved = False
         self.update_list()
 
+        if database_path:
+            self.start_load(database_path,login=True)
+
     # Logout user
     def logout(self):
-        if not self.check_unsaved_ok():
+        if not self.check_idle() or not self.check_unsaved_ok():
             return
+        self.stop_fill()
 
         self.username = ""
         self.password = ""
         self.update_user()
+        # Engines of the user's passphrase are not kept around
+        cached_crypting.cache_clear()
 
         result = db.create_data(self,self.password,placeholder = True)
         if not result:
@@ -298,18 +482,27 @@ class Manager(tk.Tk):
     def update_list(self):
         self.update_db_info()
         self.update_save_state()
-        self.depopulate()
+        # Data may have changed, next search starts from the whole database
+        self.last_search = ""
         self.populate()
 
 
     #Search functionality:
     def search_keys(self):
         text_to_search = self.search_param.get().lower()
-        found_keys = []
-        for item in self.data.keys:
-            target_name = item["target"].lower()
-            if listm.match_string(pattern= text_to_search,data=target_name):
-                found_keys.append(item)
+        if self.last_search and self.last_search in text_to_search:
+            # Query extends the previous one, its matches are a subset of the ones shown
+            found_keys = []
+            for item in self.show_data:
+                if listm.match_string(pattern= text_to_search,data=item.target.lower()):
+                    found_keys.append(item)
+        else:
+            found_keys = self.data.search_keys(text_to_search)
+            if self.sort_field is not None:
+                # Matches are taken from the sorted keys in their order, no need to sort them
+                found = set(found_keys)
+                found_keys = [item for item in self.listed_keys() if item in found]
+        self.last_search = text_to_search
         return found_keys
 
 
@@ -319,8 +512,20 @@ class Manager(tk.Tk):
         else:
             self.clear_search_button["state"]="normal"
 
+        # Search as you type, debounced
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(SEARCH_DELAY,self.live_search)
+
+    def live_search(self):
+        self.search_job = None
+        self.populate()
+
     def clear_search(self):
         self.search_param.set("")
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+            self.search_job = None
         self.clear_search_button["state"]="disabled"
         self.update_list()
 
@@ -329,7 +534,7 @@ class Manager(tk.Tk):
 
     # Add button clicked
     def click_add(self):
-        if not self.check_login_ok():
+        if not self.check_idle() or not self.check_login_ok():
             return
         if not self.check_data_ok():
             return
@@ -339,15 +544,21 @@ class Manager(tk.Tk):
             return
         new_target_val, new_name_val, new_key_val = added_entry
 
+        old_item = self.data.keys.get(new_target_val)
         check = self.data.add_key(new_target_val, new_name_val, new_key_val)
 
         if check == True:
             self.unsaved = True
-        self.update_list()
+            # Overwritten key is removed and the new one added to the end
+            self.update_row(old_item,None)
+            self.update_row(None,self.data.keys.get(new_target_val))
 
     # Item modify button clicked
     def click_modify(self,event):
-        old_target_val, old_name_val, old_key_val = listm.get_item_values(event)
+        if not self.check_idle():
+            return
+        old_item = listm.get_item(event)
+        old_target_val, old_name_val, old_key_val = old_item.fields()
         
         modified_entry = dialogs.get_user_entry(self,n_fields=3,labels=["Target: ","Name: ","Key: "],init=[old_target_val,old_name_val,old_key_val],title="Modify stored key",data_pad_char=self.data.char2)
         
@@ -357,14 +568,22 @@ class Manager(tk.Tk):
         if new_target_val == old_target_val and new_name_val == old_name_val and new_key_val == old_key_val:
             return
         
+        overwritten_item = None
+        if new_target_val != old_target_val:
+            overwritten_item = self.data.keys.get(new_target_val)
+
         check = self.data.modify_key(old_target_val,new_target_val,new_name_val,new_key_val)
         if check == True:
-                    self.unsaved = True
-        self.update_list()
+            self.unsaved = True
+            self.update_row(overwritten_item,None)
+            self.update_row(old_item,self.data.keys.get(new_target_val))
         
     # Item delete button clicked
     def click_delete(self,event):
-        target_val, name_val, key_val = listm.get_item_values(event)
+        if not self.check_idle():
+            return
+        item = listm.get_item(event)
+        target_val, name_val, key_val = item.fields()
         confirm_delete = messagebox.askyesno(title="Delete Key", 
                                             message="Do yo want to delete the following key:\n Target: {}, {}: {}".format(target_val,name_val,key_val),
                                             icon = "question")
@@ -372,11 +591,11 @@ class Manager(tk.Tk):
             check = self.data.delete_key(target_val)
             if check == True:
                 self.unsaved = True
-            self.update_list()
+                self.update_row(item,None)
 
 
     def click_copy(self,event):
-        target_val, name_val, key_val = listm.get_item_values(event)
+        target_val, name_val, key_val = listm.get_item(event).fields()
         caller = self.master
         self.clipboard_clear()
         self.clipboard_append(key_val)
@@ -385,27 +604,108 @@ class Manager(tk.Tk):
 
     # Displayed List Management
 
+    # Sorting
+    def sort_key(self,item):
+        return item.sort_key(self.sort_field)
+
+    def listed_keys(self):
+        """
+        All keys of the database in the current sort order. The sorted list is kept between searches and
+        updated by update_row, it is sorted again only for another database or sort order and after bulk changes.
+        The list is not a copy, don't change it.
+        """
+        if self.sort_field is None:
+            return list(self.data.keys)
+        if self.sorted_keys is None or self.sorted_data is not self.data:
+            self.sorted_keys = self.sort_keys(list(self.data.keys))
+            self.sorted_data = self.data
+        return self.sorted_keys
+
+    def sort_keys(self,keys):
+        """
+        Sort list of keys in the current sort order, keys stay in database order when no sort is chosen.
+        """
+        if self.sort_field is None:
+            return keys
+        if self.sort_field != "target":
+            decrypt_entries(keys)
+        keys.sort(key=self.sort_key,reverse=self.sort_reverse)
+        return keys
+
+    def sort_by(self,field):
+        # Clicking the sorted column again reverses the order
+        if field == self.sort_field:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_field = field
+            self.sort_reverse = False
+
+        for header,header_field,text in zip(self.headers,("target","name"),("Target","Name")):
+            if header_field == self.sort_field:
+                text = "{} {}".format(text,"\u25bc" if self.sort_reverse else "\u25b2")
+            header.var.set(text)
+
+        self.sorted_keys = None
+        # Sorting the shown keys keeps the search result
+        self.mainframe.set_items(self.sort_keys(self.show_data))
+
+    def make_headers(self,master):
+        self.headers = listm.make_headers(master,sort=self.sort_by)
+
     # Populate List
     def populate(self):
         if not self.search_param.get():
-            data = self.data.keys
+            # The view changes its list in place, it gets a copy
+            data = list(self.listed_keys())
+            self.last_search = ""
         else:
             data = self.search_keys()
+        self.show_data = data
+
+        # New search result or database starts from the top, sorting and loading keep the position
+        self.mainframe.set_items(data,reset=True)
+
+    # Apply change of a single key to the list
+    def update_row(self,old_item,new_item):
+        """
+        old_item: Key shown before the change, None for added keys
+        new_item: Key after the change, None for removed keys
+        """
+        if self.sort_field is not None and self.sorted_keys is not None and self.sorted_data is self.data:
+            # The sorted keys hold every key, also the ones the search hides
+            if old_item is not None:
+                position = listm.sorted_index(self.sorted_keys,old_item,key=self.sort_key,reverse=self.sort_reverse)
+                if position is not None:
+                    del self.sorted_keys[position]
+            if new_item is not None:
+                position = listm.sorted_position(self.sorted_keys,new_item,key=self.sort_key,reverse=self.sort_reverse)
+                self.sorted_keys.insert(position,new_item)
+        if new_item is not None and not self.matches_search(new_item):
+            new_item = None
+
+        if self.sort_field is not None:
+            # Sorted list: take the old key out and put the new one in its sorted place
+            if old_item is not None:
+                self.mainframe.remove_item(old_item)
+            if new_item is not None:
+                position = listm.sorted_position(self.show_data,new_item,key=self.sort_key,reverse=self.sort_reverse)
+                self.mainframe.insert_item(position,new_item)
+        elif old_item is not None and new_item is not None:
+            self.mainframe.update_item(old_item,new_item)
+        elif old_item is not None:
+            self.mainframe.remove_item(old_item)
+        elif new_item is not None:
+            self.mainframe.append_item(new_item)
 
-        listm.make_headers(self.mainframe.scrollable_frame)
+        self.update_db_info()
+        self.update_save_state()
 
-        for n,item in enumerate(data):
-            frame = listm.ItemFrame(self.mainframe.scrollable_frame,name=str(n))
-            target_entry = listm.ItemEntry(frame,text=item["target"],name="target{}".format(n))
-            name_entry = listm.ItemEntry(frame,text=item["name"],name="name{}".format(n))
-            key_entry = listm.ItemEntry(frame,text=item["key"],name="key{}".format(n))
-            button_modify = listm.ItemButton(frame,function=self.click_modify,text="Modify", name="modify{}".format(n))
-            button_delete = listm.ItemButton(frame,function=self.click_delete,text="Delete", name="delete{}".format(n))
-            
-    # Clear List
-    def depopulate(self):
-        for widget in self.mainframe.scrollable_frame.winfo_children():
-            widget.destroy()
+    def matches_search(self,item):
+        text_to_search = self.search_param.get().lower()
+        return listm.match_string(pattern= text_to_search,data=item.target.lower())
+
+    def make_row(self,master,n):
+        return listm.ItemRow(master,n,modify=self.click_modify,delete=self.click_delete)
 
 
     # Display About Info
@@ -414,14 +714,91 @@ class Manager(tk.Tk):
 
     # Finally
     def quit_app(self):
+        if not self.check_idle():
+            return
         self.destroy()
 
 
+    # Background tasks
+    def run_task(self,text,work,done=None,progress=None,failed=None):
+        """
+        Run work() on a worker thread, done(result) is called on the Tk thread when it returns.
+        With progress, work is called as work(report) and every report(value) calls progress(value) on the Tk thread.
+        When work or progress raises, failed(error) is called on the Tk thread when work has returned, without failed
+        the error is shown in a message box. Reports after a failed progress call are dropped.
+        Only one task runs at a time, edits and other file operations are blocked until it has finished.
+        Work must not touch any widgets or open dialogs.
+        """
+        self.set_busy(text)
+        self.task_failed = failed
+        self.task_error = None
+
+        def report(value):
+            self.task_results.put((progress,value,None,False))
+
+        def worker():
+            try:
+                result = work(report) if progress is not None else work()
+                self.task_results.put((done,result,None,True))
+            except Exception as error:
+                self.task_results.put((failed,None,error,True))
+
+        threading.Thread(target=worker,daemon=True).start()
+        self.after(TASK_POLL,self.poll_task)
+
+    def poll_task(self):
+        while True:
+            try:
+                callback, result, error, final = self.task_results.get_nowait()
+            except queue.Empty:
+                self.after(TASK_POLL,self.poll_task)
+                return
+            if final:
+                break
+            if self.task_error is None:
+                try:
+                    callback(result)
+                except Exception as progress_error:
+                    self.task_error = progress_error
+
+        text = self.task_var.get()
+        self.set_busy(None)
+        if error is None and self.task_error is not None:
+            callback, error = self.task_failed, self.task_error
+        if error is not None:
+            if callback is not None:
+                callback(error)
+            else:
+                messagebox.showerror(title="Operation failed",message="{}\n{}".format(text,error))
+        elif callback is not None and result is not None:
+            callback(result)
+
+    def set_busy(self,text):
+        self.busy = text is not None
+        state = "disabled" if self.busy else "normal"
+        for button in (self.login_button,self.add_button,self.save_button):
+            button.config(state=state)
+
+        if self.busy:
+            self.task_var.set(text)
+            self.progress.pack(side="right")
+            self.task_info.pack(side="right")
+            self.progress.start()
+        else:
+            self.progress.stop()
+            self.progress.pack_forget()
+            self.task_info.pack_forget()
+            self.task_var.set("")
+
+
 
 
 
 
 if __name__ == "__main__":
 
+    # Locale-aware sorting of the key list
+    locale.setlocale(locale.LC_COLLATE,"")
+
     app = Manager()
     app.mainloop()
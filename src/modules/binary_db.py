@@ -0,0 +1,180 @@
+"""
+Binary database container.
+
+Layout (big-endian):
+    Header:         magic "SPMV" (4 bytes), format version (1 byte), header length (4 bytes), entry count (4 bytes)
+    Header data:    JSON object with the database parameters (codec, char1, char2, mode, cipher, indexed)
+    Offset table:   per entry 8 byte absolute offset of the record and 8 byte keyed digest of the target
+                    (version 1 files have offsets only). Digests are zero when "indexed" is false.
+    Records:        4 byte lengths of target, name and key, followed by the raw field bytes.
+                    Encrypted fields hold raw ciphertext, plaintext fields the encoded string.
+"""
+
+import json
+import mmap
+import struct
+
+
+MAGIC = b"SPMV"
+VERSION = 2
+
+HEADER = struct.Struct("!4sBII")
+INDEX = {1: struct.Struct("!Q"), 2: struct.Struct("!Q8s")}
+RECORD = struct.Struct("!III")
+NO_DIGEST = bytes(8)
+
+
+def is_binary_db(path):
+    with open(path,"rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def write_binary_db(path,header,records,digests=None):
+    """
+    args:
+        header : dict       Database parameters
+        records : list      (target, name, key) byte strings of every entry
+        digests : list      8 byte target digests of every entry, used by MappedDatabase.find.
+                            Without digests the file is written unindexed.
+    """
+    header = dict(header,indexed=digests is not None)
+    header_data = json.dumps(header).encode("utf-8")
+    index = INDEX[VERSION]
+    offset = HEADER.size + len(header_data) + index.size * len(records)
+
+    if digests is None:
+        digests = [NO_DIGEST]*len(records)
+
+    offsets = bytearray()
+    for record,digest in zip(records,digests):
+        offsets += index.pack(offset,digest)
+        offset += RECORD.size + sum(len(field) for field in record)
+
+    with open(path,"wb") as file:
+        file.write(HEADER.pack(MAGIC,VERSION,len(header_data),len(records)))
+        file.write(header_data)
+        file.write(offsets)
+        for target,name,key in records:
+            file.write(RECORD.pack(len(target),len(name),len(key)))
+            file.write(target)
+            file.write(name)
+            file.write(key)
+
+
+def read_fields(buf,offset):
+    """
+    Read (target, name, key) record starting at offset. Fields are slices of buf.
+    """
+    len_target, len_name, len_key = RECORD.unpack_from(buf,offset)
+    target = offset + RECORD.size
+    name = target + len_target
+    key = name + len_name
+    return buf[target:name], buf[name:key], buf[key:key+len_key]
+
+
+def read_header(buf):
+    """
+    Returns (header dict, entry count, offset of the offset table, format version)
+    """
+    magic, version, header_len, count = HEADER.unpack_from(buf,0)
+    if magic != MAGIC:
+        raise ValueError("Not a binary database file.")
+    if version not in INDEX:
+        raise ValueError("Binary database version {} is not supported. Latest supported version is {}.".format(version,VERSION))
+    header = json.loads(bytes(buf[HEADER.size:HEADER.size+header_len]).decode("utf-8"))
+    header.setdefault("indexed",False)
+    return header, count, HEADER.size + header_len, version
+
+
+def iter_records(buf,offset,count):
+    """
+    Yield (target, name, key) byte strings of count records stored back to back from offset.
+    """
+    unpack = RECORD.unpack_from
+    for n in range(count):
+        len_target, len_name, len_key = unpack(buf,offset)
+        target = offset + RECORD.size
+        name = target + len_target
+        key = name + len_name
+        offset = key + len_key
+        yield buf[target:name], buf[name:key], buf[key:offset]
+
+
+def iter_binary_db(path):
+    """
+    Returns (header dict, iterator of (target, name, key) byte strings)
+    Records are read one at a time, so the caller can store them without an intermediate list.
+    """
+    with open(path,"rb") as file:
+        buf = file.read()
+
+    header, count, table, version = read_header(buf)
+
+    # Records are stored back to back, so they can be read in order without the offset table
+    return header, iter_records(buf,table + count*INDEX[version].size,count)
+
+
+def read_binary_db(path):
+    """
+    Returns (header dict, list of (target, name, key) byte strings)
+    """
+    header, records = iter_binary_db(path)
+    return header, list(records)
+
+
+class MappedDatabase:
+    """
+    Read-only memory-mapped binary database.
+    Only the header is parsed on opening, records are read from the map when asked for.
+
+    m = MappedDatabase(path)
+    m.header                Database parameters
+    len(m)                  Number of records
+    m.record(n)             (target, name, key) memoryviews of the n:th record
+    m.records()             Iterator of the records of all entries
+    m.find(digest)          Record numbers with given target digest
+    m.find_records(digest)  Records with given target digest
+    m.close()               Release the map, returned memoryviews must not be used after this.
+    """
+    def __init__(self,path):
+        self.file = open(path,"rb")
+        self.map = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        self.buf = memoryview(self.map)
+        self.header, self.count, self.table, version = read_header(self.buf)
+        self.index = INDEX[version]
+        self.indexed = self.header["indexed"] and version >= 2
+
+    def __len__(self):
+        return self.count
+
+    def record(self,n):
+        if not 0 <= n < self.count:
+            raise IndexError("Record number out of range.")
+        offset = self.index.unpack_from(self.buf,self.table + n*self.index.size)[0]
+        return read_fields(self.buf,offset)
+
+    def records(self):
+        for n in range(self.count):
+            yield self.record(n)
+
+    def find(self,digest):
+        if not self.indexed:
+            raise ValueError("Binary database has no target index.")
+        # Search the digest column of the offset table with mmap.find, skip hits not aligned to an entry
+        found = []
+        end = self.table + self.count*self.index.size
+        pos = self.map.find(digest,self.table,end)
+        while pos != -1:
+            entry, column = divmod(pos - self.table,self.index.size)
+            if column == 8:
+                found.append(entry)
+            pos = self.map.find(digest,pos+1,end)
+        return found
+
+    def find_records(self,digest):
+        return [self.record(n) for n in self.find(digest)]
+
+    def close(self):
+        self.buf.release()
+        self.map.close()
+        self.file.close()
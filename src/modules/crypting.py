@@ -1,19 +1,33 @@
-from modules.xtea import XTEA
+import os
+import hashlib
+from functools import lru_cache
+from modules.xtea import make_engine
 from math import ceil
 
 
+CIPHER_MODES = ("ecb","ctr")
+
+# Number of Crypting objects kept by cached_crypting
+CACHE_SIZE = 8
+
+
 class Crypting:
-    def __init__(self,passphrase: str,pass_padding:str,data_padding:str = None, encoding:str = "utf-8"):
+    def __init__(self,passphrase: str,pass_padding:str,data_padding:str = None, encoding:str = "utf-8", cipher_mode:str = "ecb"):
         """
         Encryption/decryption class for arbitary string
         "Privacy" level of encryption. While generally regarded as safe, not necessarily suited for heavy duty secrecy.
         Arg:
             passphrase: str     key used to encrypt / decrypt data = 128 bit (byte length of 16 char or less) 
+                        bytes   Raw 128 bit key (16 bytes), used as is without padding
             pass_padding: str   Single byte charachter
             data_padding: str   Single byte charachter, defaults to pass_padding
             n_rounds: int       Number of encryption passes, defaults to 32 (64 Feistel rounds)
             encoding: str       Encoding of human-readable strings, defaults to "utf-8"
             endian: str         Byte order, defaults to Big-endian/network ("!")
+            cipher_mode: str    "ecb"   Padded field is encrypted block by block (default, original format)
+                                "ctr"   Counter mode. Field is XORed with encrypted counter blocks
+                                        starting from a random 8 byte nonce stored in front of the
+                                        ciphertext. No padding, any byte range can be decrypted alone.
 
         c = XTEA(*args)
 
@@ -28,12 +42,53 @@ class Crypting:
             string: str         Encrypted hex string 
         Returns:                Decrypted human-readable string
 
+
+        c.encrypt_many(strings) / c.decrypt_many(strings)
+        Args:
+            strings: list       List of strings as for encrypt / decrypt
+        Returns:                List of results, same as calling encrypt / decrypt for each.
+                                All fields are run through the block engine in a single call.
+
+
+        c.encrypt_raw_many(strings) / c.decrypt_raw_many(byte_strings)
+                                As encrypt_many / decrypt_many, but ciphertext is raw bytes instead of hex.
+                                Decryption accepts any bytes-like object, e.g. a memoryview.
+
+
+        c.wrap_key(key) / c.unwrap_key(wrapped)
+        Args:
+            key: bytes          Raw 16 byte key, e.g. the data key of a database
+        Returns:                Key encrypted / decrypted with this key, always block by block
+                                and without padding, whatever the cipher mode.
+
+
+        c.target_digest(string)
+        Returns:                8 byte keyed hash (BLAKE2b) of the string
+
+
+        c.check_value(data)
+        Args:
+            data: bytes         Data bound to the check value, e.g. a wrapped key
+        Returns:                16 byte keyed hash (BLAKE2b) of the data, tells whether the same key was used
+
+
+        c.decrypt_range(string,start,stop)
+        Args:
+            string: str         Encrypted hex string
+            start, stop: int    Byte range of the plaintext
+        Returns:                Decrypted bytes of the range, only the blocks covering the range are decrypted.
+                                In "ecb" mode the range may contain padding characters.
+
         """
 
         self.encoding = encoding
         self.pass_padding = pass_padding.encode(self.encoding)
         self.key = self._encode_key(passphrase)
-        self.engine = XTEA(self.key)
+        self.engine = make_engine(self.key)
+
+        if cipher_mode not in CIPHER_MODES:
+            raise ValueError("Unknown cipher mode {}. Cipher mode must be one of {}.".format(cipher_mode,", ".join(CIPHER_MODES)))
+        self.cipher_mode = cipher_mode
 
         if data_padding == None:
             self.data_padding = self.pass_padding
@@ -49,6 +104,10 @@ class Crypting:
 
 
     def _encode_key(self,passphrase:str):
+        if isinstance(passphrase,bytes):
+            if len(passphrase) != 16:
+                raise ValueError("Bad raw key. Raw key must have byte string length of 16, got {}.".format(len(passphrase)))
+            return passphrase
         key = passphrase.encode(self.encoding)
         if len(key) > 16:
             raise ValueError("Passphrase maximum length exceeded. Maximum byte string length is 16. {} has length of {} with {}.".format(key.decode(self.encoding),len(key),self.encoding))
@@ -57,19 +116,14 @@ class Crypting:
         return key
 
 
-    def _generate_block(self,data:bytes):
-        # Calc number of blocks
+    def _pad_data(self,data:bytes):
+        # Pad data to block divisable length, already aligned data (e.g. memoryview of ciphertext) is used as is
         block_len = 8
-        n_blocks_float = len(data)/block_len
-        n_blocks = ceil(n_blocks_float)
-
-        # Pad data to block divisable length
+        if len(data) % block_len == 0:
+            return data
+        n_blocks = ceil(len(data)/block_len)
         pad_len = block_len * n_blocks
-        data = data.ljust(pad_len,self.data_padding)
-
-        for n in range(n_blocks):
-            block = data[n*block_len : (n + 1)*block_len]
-            yield block
+        return bytes(data).ljust(pad_len,self.data_padding)
 
 
     def _sanitize_output(self,output):
@@ -77,40 +131,166 @@ class Crypting:
         return output
 
 
-    def encrypt(self,data: str):
-        data = data.encode(self.encoding)
-        return_seq = bytearray()
+    def _decode_output(self,return_seq):
+        try:
+            return_seq = return_seq.decode(self.encoding)
+        except UnicodeError:
+            return_seq = return_seq.hex()
 
-        for block in self._generate_block(data):
-                    
-            return_seq += self.engine.encrypt(block)
+        return return_seq
 
-        return_seq = return_seq.hex()
 
-        return return_seq
+    def _process_many(self,fields,processor):
+        # Run all padded fields through the engine at once and cut the result back to fields
+        output = processor(b"".join(fields))
+        return_seqs = []
+        pos = 0
+        for field in fields:
+            return_seqs.append(output[pos:pos+len(field)])
+            pos += len(field)
+        return return_seqs
+
+
+    def _keystreams(self,nonces,lengths,first_block=0):
+        # Counter blocks of all fields are encrypted in a single engine call
+        counters = bytearray()
+        n_blocks = []
+        for nonce,length in zip(nonces,lengths):
+            start = int.from_bytes(nonce,"big") + first_block
+            n = ceil(length/8)
+            for block in range(start,start+n):
+                counters += (block & 0xffffffffffffffff).to_bytes(8,"big")
+            n_blocks.append(n)
+
+        stream = self.engine.encrypt_blocks(counters)
+        return_seqs = []
+        pos = 0
+        for n,length in zip(n_blocks,lengths):
+            return_seqs.append(stream[pos:pos+length])
+            pos += 8*n
+        return return_seqs
+
+
+    def _xor(self,data,stream):
+        return (int.from_bytes(data,"big") ^ int.from_bytes(stream,"big")).to_bytes(len(data),"big")
+
+
+    def _encrypt_fields(self,fields):
+        """
+        Encrypt list of plaintext byte strings, returns list of ciphertext byte strings.
+        """
+        if self.cipher_mode == "ctr":
+            nonces = [os.urandom(8) for field in fields]
+            streams = self._keystreams(nonces,[len(field) for field in fields])
+            return [nonce + self._xor(field,stream) for nonce,field,stream in zip(nonces,fields,streams)]
+
+        fields = [self._pad_data(field) for field in fields]
+        return self._process_many(fields,self.engine.encrypt_blocks)
+
+
+    def _decrypt_fields(self,fields):
+        """
+        Decrypt list of ciphertext byte strings, returns list of plaintext byte strings.
+        """
+        if self.cipher_mode == "ctr":
+            nonces = [field[:8] for field in fields]
+            fields = [field[8:] for field in fields]
+            streams = self._keystreams(nonces,[len(field) for field in fields])
+            return [self._xor(field,stream) for field,stream in zip(fields,streams)]
+
+        fields = [self._pad_data(field) for field in fields]
+        return [self._sanitize_output(field) for field in self._process_many(fields,self.engine.decrypt_blocks)]
+
+
+    def encrypt(self,data: str):
+        return self.encrypt_many([data])[0]
 
 
     def decrypt(self,data: str):
-        data = bytearray.fromhex(data)
-        return_seq = bytearray()
+        return self.decrypt_many([data])[0]
 
-        for block in self._generate_block(data):
-            
-            return_seq += self.engine.decrypt(block)
 
-        return_seq = self._sanitize_output(return_seq)
-        try:
-            return_seq = return_seq.decode(self.encoding)
-        except UnicodeError:
-            return_seq = return_seq.hex()
+    def encrypt_many(self,data_list):
+        fields = [data.encode(self.encoding) for data in data_list]
+        return [seq.hex() for seq in self._encrypt_fields(fields)]
 
-        return return_seq
+
+    def decrypt_many(self,data_list):
+        fields = [bytes.fromhex(data) for data in data_list]
+        return [self._decode_output(seq) for seq in self._decrypt_fields(fields)]
+
+
+    def encrypt_raw_many(self,data_list):
+        return self._encrypt_fields([data.encode(self.encoding) for data in data_list])
+
+
+    def decrypt_raw_many(self,data_list):
+        return [self._decode_output(seq) for seq in self._decrypt_fields(data_list)]
+
+
+    def wrap_key(self,key: bytes):
+        if len(key) != 16:
+            raise ValueError("Bad raw key. Raw key must have byte string length of 16, got {}.".format(len(key)))
+        return self.engine.encrypt_blocks(key)
+
+
+    def unwrap_key(self,wrapped: bytes):
+        if len(wrapped) != 16:
+            raise ValueError("Bad wrapped key. Wrapped key must have byte string length of 16, got {}.".format(len(wrapped)))
+        return self.engine.decrypt_blocks(wrapped)
+
+
+    def target_digest(self,data: str):
+        """
+        8 byte keyed hash of the string, used to look up entries without decrypting them.
+        """
+        return hashlib.blake2b(data.encode(self.encoding),key=self.key,digest_size=8).digest()
+
+
+    def check_value(self,data: bytes = b""):
+        """
+        Keyed hash for checking the key without decrypting anything, distinct from target digests of the same key.
+        """
+        return hashlib.blake2b(data,key=self.key,digest_size=16,person=b"SPM check value").digest()
+
+
+    def decrypt_range(self,data: str,start: int,stop: int):
+        data = bytes.fromhex(data)
+        if self.cipher_mode == "ctr":
+            nonce, data = data[:8], data[8:]
+
+        stop = min(stop,len(data))
+        if start >= stop:
+            return b""
+        first_block = start // 8
+        offset = 8 * first_block
+        blocks = data[offset:8*ceil(stop/8)]
+
+        if self.cipher_mode == "ctr":
+            stream = self._keystreams([nonce],[len(blocks)],first_block)[0]
+            plain = self._xor(blocks,stream)
+        else:
+            plain = self.engine.decrypt_blocks(self._pad_data(blocks))
+
+        return plain[start-offset:stop-offset]
 
     def __repr__(self):
-        passph = self.key.decode(self.encoding)
+        passph = self._decode_output(self.key)
         pass_pad = self.pass_padding.decode(self.encoding)
         data_pad = self.data_padding.decode(self.encoding)
-        return "<Crypting Obj - Passphrase: {}, Passphrase padding: {}, Data padding: {}, Encoding: {}>".format(passph,pass_pad,data_pad,self.encoding)
+        return "<Crypting Obj - Passphrase: {}, Passphrase padding: {}, Data padding: {}, Encoding: {}, Cipher mode: {}>".format(passph,pass_pad,data_pad,self.encoding,self.cipher_mode)
+
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def cached_crypting(passphrase,pass_padding,data_padding=None,encoding="utf-8",cipher_mode="ecb"):
+    """
+    Crypting for the arguments, shared by everyone asking with the same arguments, so the key schedule
+    is computed once. The least recently used object is dropped when CACHE_SIZE objects are kept.
+    Give the arguments in the same form (positional / keyword) every time, they are cached as given.
+    cached_crypting.cache_clear() drops all of them.
+    """
+    return Crypting(passphrase,pass_padding,data_padding,encoding,cipher_mode)
 
 
 
@@ -155,7 +335,7 @@ if __name__ == "__main__":
             valid_data_chars = "".join((valid_data_chars,char))
 
 
-        c = Crypting(password,pass_pad,data_pad)
+        c = Crypting(password,pass_pad,data_pad,cipher_mode=CIPHER_MODES[n % 2])
         print(c)
 
         for i in range(50):
@@ -172,6 +352,12 @@ if __name__ == "__main__":
                 print("Error Encrypting / decrypting data: {}".format(data))
                 print("    No encryption achieved.")
                 error_counter += 1
+            data_bytes = data.encode("utf-8")
+            start = random.randint(0,len(data_bytes))
+            stop = random.randint(start,len(data_bytes))
+            if c.decrypt_range(encrypted,start,stop) != data_bytes[start:stop]:
+                print("Error decrypting range {}:{} of data: {}".format(start,stop,data))
+                error_counter += 1
             test_counter += 1
         print()
     print()
@@ -1,16 +1,88 @@
+import hmac
 import json
 import os
+from itertools import islice, takewhile
 from tkinter import messagebox, filedialog
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
 
 import modules.dialogs as dialogs
-from modules.crypting import Crypting
+import modules.binary_db as binary_db
+import modules.jsonl_db as jsonl_db
+import modules.journal as journal
+import modules.sqlite_db as sqlite_db
+from modules.crypting import cached_crypting
+from modules.entries import KeyEntry, KeyStore, decrypt_entries
 
 
-DEFAULT_DATABASE = [("JSON File", "*.json"),("Back-up File", "*.bak")]
+DEFAULT_DATABASE = [("JSON File", "*.json"),("Back-up File", "*.bak"),("Binary Database", "*.spmv"),("JSON Lines", "*.jsonl"),("SQLite Database", "*.db")]
+
+FIELDS = ("target","name","key")
+
+# Batches of at least this many fields are encrypted / decrypted in a process pool
+PARALLEL_THRESHOLD = 50000
+
+# Keys are read and written this many at a time when streaming JSON Lines files
+STREAM_BATCH = 1000
+
+# Keys are handed over this many at a time when a database is read progressively
+LOAD_BATCH = 1000
+
+# Journal is merged into the database file once it grows past this many bytes
+JOURNAL_LIMIT = 1024*1024
+
+# Header of a database file lies within this many bytes from the start, the wrapped data key is overwritten there
+HEADER_SPAN = 4096
+
+# Policies for keys of a batch whose target already exists: overwrite the existing key, skip the new one,
+# or ask the user once for the whole batch
+CONFLICT_POLICIES = ("overwrite","skip","ask")
+
+# Conflicting targets listed in the dialog of the "ask" policy
+CONFLICTS_SHOWN = 10
+
+# Fields of the key operations recorded in the journal
+OPERATIONS = {"add": FIELDS, "modify": ("target",)+FIELDS, "delete": ("target",)}
+
+
+class WrongPasswordError(Exception):
+    """
+    Passphrase does not match the verifier in the header of the database file.
+    """
+
+
+# Process pool workers. Each worker builds its own Crypting once from the database parameters.
+_worker_crypt = None
+
+def _init_worker(secret,pass_pad,data_pad,codec,cipher):
+    global _worker_crypt
+    _worker_crypt = cached_crypting(secret,pass_pad,data_pad,codec,cipher)
+
+def _process_chunk(values,processor):
+    return getattr(_worker_crypt,processor)(values)
+
+
+def encrypted_fields(mode):
+    """
+    Fields that are encrypted in given encryption mode.
+    """
+    return {0:(),1:("name","key"),2:("target","name","key")}[mode]
+
+
+def batches(iterable,size):
+    """
+    Yield lists of up to size items of iterable.
+    """
+    iterator = iter(iterable)
+    batch = list(islice(iterator,size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator,size))
+
 
 class KeyDatabase:
-    def __init__(self,passphrase:str,codec:str="",pass_pad:str="",data_pad:str="",mode:int=2,from_file:bool=False,path:str="",placeholder=False):
+    def __init__(self,passphrase:str,codec:str="",pass_pad:str="",data_pad:str="",mode:int=2,from_file:bool=False,path:str="",placeholder=False,parallel:bool=True,cipher:str="ecb",mapped:bool=False,journal_limit:int=JOURNAL_LIMIT,progressive:bool=False):
         """
         args:
             codec : str         Name of the coded used in human-readable strings, e.g. 'utf-8'.
@@ -22,42 +94,121 @@ class KeyDatabase:
                                 2   Encrypt pasword target, username and password.
             from_file : bool    Read database from a file
             path : str          Valid path for reading and saving the data.
+            parallel : bool     Use a process pool for batches of at least PARALLEL_THRESHOLD fields.
+            cipher : str        Cipher mode of the fields, "ecb" or "ctr" (see Crypting).
+                                Files without cipher in the header are read as "ecb".
+            mapped : bool       Memory-map a binary database file. Only the header is read on opening,
+                                lookup() reads single records from the map until the keys are accessed.
+                                SQLite database files are always opened this way.
+            journal_limit : int Size in bytes the journal of the database file may grow to before save_db
+                                rewrites the whole file.
+            progressive : bool  Read only the header of the file. The keys come from iterator 'batches'
+                                in lists of LOAD_BATCH KeyEntry objects, see read_batches.
+
+        Keys are encrypted with a random data key. The header holds the data key wrapped (encrypted) with the
+        passphrase, so changing the passphrase only rewrites the wrapped key. Files without a data key in the
+        header are encrypted with the passphrase itself, they get a data key when the passphrase is changed.
+        The header also holds a verifier of the passphrase, a wrong passphrase raises WrongPasswordError
+        before any key is read. Files without a verifier get one when they are next written in full.
         """
+        self.parallel = parallel
+        self.file_format = "json"
+        self.mapped_db = None
+        self._keys = KeyStore()
+        self.journal_limit = journal_limit
+        self.journal_ops = None
+        self.saved_state = None
+        self.snapshot = None
+        self.data_key = None
+        self.crypt_params = None
+        self.key_params = None
 
         if from_file:
             if not path or not os.path.exists(path):
                 raise Exception("KeyDatabase initialized with non-existing path.")
             self.passphrase = passphrase
-            self.read_db(path)
+            if progressive:
+                self.batches = self.read_batches(path)
+            else:
+                self.read_db(path,mapped=mapped)
         else:
             self.passphrase = passphrase
             self.codec = codec
             self.char1 = pass_pad
             self.char2 = data_pad
             self.mode =  mode
-            self.keys = []
-            self.crypt = Crypting(passphrase,pass_pad,data_pad,codec)
+            self.cipher = cipher
+            self.data_key = os.urandom(16)
+            self.keys = KeyStore()
+            self.update_crypting()
 
             if mode != 0 and mode != 1 and mode != 2:
                 raise ValueError("Invalid encryption mode. Encryption mode must be '0','1' or '2'")
         self.isplaceholder = placeholder
 
 
+    @property
+    def keys(self):
+        """
+        KeyStore of the keys. A memory-mapped database is read into the store on first access.
+        """
+        if self.mapped_db is not None:
+            self.release_mapping()
+        return self._keys
+
+    @keys.setter
+    def keys(self,keys):
+        if not isinstance(keys,KeyStore):
+            keys = KeyStore(keys)
+        self._keys = keys
+        # A replaced store can't be described as key operations, next save_db rewrites the file
+        self.journal_ops = None
+
     def update_crypting(self):
-        self.crypt = Crypting(passphrase = self.passphrase, 
-                              pass_padding=self.char1, 
-                              data_padding=self.char2, 
-                              encoding=self.codec)
+        # Keep the current engine when nothing changed, so the ciphertext held by the keys stays valid.
+        # A new engine makes all keys dirty, the ciphertext they hold is then only used to decrypt them.
+        # With a data key the passphrase only changes the engine wrapping it.
+        # Engines come from cached_crypting, switching back to earlier parameters (e.g. saving a backup
+        # with the old passphrase) or reading the file again reuses the engine made for them.
+        if self.data_key is None and self.crypt_params is not None and self.crypt_params[0] != self.passphrase:
+            # Keys encrypted with the passphrase are encrypted again anyway, move them to a data key
+            self.data_key = os.urandom(16)
+
+        key_params = (self.passphrase,self.char1,self.codec)
+        if self.key_params != key_params:
+            self.key_crypt = cached_crypting(self.passphrase,self.char1,None,self.codec)
+            self.key_params = key_params
+
+        secret = self.passphrase if self.data_key is None else self.data_key
+        params = (secret,self.char1,self.char2,self.codec,self.cipher)
+        if self.crypt_params == params:
+            return
+        self.crypt = cached_crypting(*params)
+        self.crypt_params = params
+
+    def key_header(self):
+        """
+        Header values that change with the passphrase, as hex strings: the data key encrypted with the passphrase
+        (when there is one) and the verifier, a keyed check value of the passphrase bound to the wrapped key.
+        """
+        header = dict()
+        wrapped = b""
+        if self.data_key is not None:
+            wrapped = self.key_crypt.wrap_key(self.data_key)
+            header["data_key"] = wrapped.hex()
+        header["verifier"] = self.key_crypt.check_value(wrapped).hex()
+        return header
+
+    def _check_passphrase(self,header):
+        if "verifier" not in header:
+            return
+        wrapped = bytes.fromhex(header.get("data_key") or "")
+        # Compared in constant time, nothing is decrypted before the passphrase is known to be right
+        if not hmac.compare_digest(self.key_crypt.check_value(wrapped),bytes.fromhex(header["verifier"])):
+            raise WrongPasswordError("Wrong password for this database.")
 
     def add_key(self,new_target,new_name,new_key):
-        existing_key = False
-        existing_key_loc = 0
-        for n,item in enumerate(self.keys):
-            if new_target == item["target"]:
-                existing_key = True
-                existing_key_loc = n
-
-        if existing_key:
+        if new_target in self.keys:
             confirm_add = messagebox.askyesno(title="Key already exists", 
                                              message="""Key for {} already exists in the database.\nDatabase can't hold multible keys for the same target.\nExisting key will be overwritten by this one.\nDo you want to continue.""".format(new_target),
                                              icon = "question")
@@ -65,109 +216,654 @@ class KeyDatabase:
                 # Call dialogbox with previous values
                 return
 
-            #overwrite previous key
-            self.keys.pop(existing_key_loc)
-
-        self.keys.append({"target":new_target,"name":new_name,"key":new_key})
+        # overwrites previous key
+        self.keys.add(KeyEntry(new_target,new_name,new_key))
+        self._log("add",new_target,new_name,new_key)
         
         return True
 
  
     def modify_key(self,old_target,new_target,new_name,new_key):
-        existing_keys = []
-        for item in self.keys:
-            existing_keys.append(item["target"])
-
-        if new_target != old_target and new_target in existing_keys:
+        if new_target != old_target and new_target in self.keys:
             confirm_modify = messagebox.askyesno(title="Key already exists", 
                                              message="""Key for {} already exists in the database.\nDatabase can't hold multible keys for the same target.\nExisting key will be overwritten by this one.\nDo you want to continue.""".format(new_target),
                                              icon = "question")
             if not confirm_modify:
                 return
 
-        # new_data = self.prime_database(self.data["codec"],self.data["char1"],self.data["char2"],mode=self.data["mode"])
-        new_keys = []
-
-        for item in self.keys:
-            if item["target"] == old_target:
-                new_keys.append({"target":new_target,"name":new_name,"key":new_key})
-                continue
-            if item["target"] != new_target:
-                new_keys.append(item)
-
-        self.keys = new_keys
+        self.keys.replace(old_target,KeyEntry(new_target,new_name,new_key))
+        self._log("modify",old_target,new_target,new_name,new_key)
         return True
 
 
     def delete_key(self,target):
-        existing_key = False
-        existing_key_loc = 0
-        for n,item in enumerate(self.keys):
-            if target == item["target"]:
-                existing_key = True
-                existing_key_loc = n
-        if existing_key:
-            self.keys.pop(existing_key_loc)
+        if self.keys.remove(target) is not None:
+            self._log("delete",target)
             return True
 
-    def _process_keys(self,keys,processor):
-        """
-        Processor must be either
-        self.crypt.encrypt 
-        or
-        self.crypt.decrypt
-        """
-        if self.mode == 0:
-            return keys
-        elif self.mode == 1 or self.mode == 2:
-            ret_keys = []
-            for key in keys:
-                entry = dict()
-                if self.mode == 1:
-                    entry["target"] = key["target"]
-                else:
-                    entry["target"] = processor(key["target"])
-                entry["name"] = processor(key["name"])
-                entry["key"] = processor(key["key"])
-                ret_keys.append(entry)
-            return ret_keys
+    # Batch operations, conflicts are resolved for the whole batch and no dialog is shown per key
+    def add_keys(self,keys,policy="ask"):
+        """
+        Add keys from an iterable of (target, name, key). Keys whose target is already in the database or earlier
+        in the batch are conflicts, resolved by policy (see CONFLICT_POLICIES).
+        Returns number of keys added, None when the user cancelled.
+        """
+        keys = list(keys)
+        policy = self._resolve_policy([target for target,_,_ in keys],policy)
+        if policy is None:
+            return None
+
+        store = self.keys
+        added = 0
+        for target,name,key in keys:
+            if policy == "skip" and target in store:
+                continue
+            store.add(KeyEntry(target,name,key))
+            self._log("add",target,name,key)
+            added += 1
+        return added
+
+    def upsert_keys(self,keys,policy="ask"):
+        """
+        Modify keys from an iterable of (old_target, target, name, key), keys whose old target is not in
+        the database are added. Renaming a key to a target that is already in use is a conflict, resolved by policy.
+        Returns number of keys written, None when the user cancelled.
+        """
+        keys = list(keys)
+        policy = self._resolve_policy([target for old_target,target,_,_ in keys],policy,[old_target for old_target,_,_,_ in keys])
+        if policy is None:
+            return None
+
+        store = self.keys
+        written = 0
+        for old_target,target,name,key in keys:
+            if policy == "skip" and target != old_target and target in store:
+                continue
+            store.replace(old_target,KeyEntry(target,name,key))
+            self._log("modify",old_target,target,name,key)
+            written += 1
+        return written
+
+    def delete_keys(self,targets):
+        """
+        Delete keys of an iterable of targets, missing targets are ignored. Returns number of keys deleted.
+        """
+        store = self.keys
+        deleted = 0
+        for target in targets:
+            if store.remove(target) is not None:
+                self._log("delete",target)
+                deleted += 1
+        return deleted
+
+    def _resolve_policy(self,targets,policy,old_targets=None):
+        """
+        Find in one pass the targets that are already in the database or earlier in the batch.
+        With old_targets, a target equal to its old target is no conflict.
+        Returns "overwrite" or "skip", policy "ask" asks the user once when there are conflicts. None if cancelled.
+        """
+        if policy not in CONFLICT_POLICIES:
+            raise ValueError("Unknown conflict policy {}. Policy must be one of {}.".format(policy,", ".join(CONFLICT_POLICIES)))
+        if policy != "ask":
+            return policy
+
+        if old_targets is None:
+            old_targets = [None]*len(targets)
+        store = self.keys
+        seen = set()
+        conflicts = []
+        for target,old_target in zip(targets,old_targets):
+            if target != old_target and (target in store or target in seen):
+                conflicts.append(target)
+            seen.add(target)
+        if not conflicts:
+            return "overwrite"
+
+        shown = "\n".join(conflicts[:CONFLICTS_SHOWN])
+        if len(conflicts) > CONFLICTS_SHOWN:
+            shown += "\n... and {} more".format(len(conflicts)-CONFLICTS_SHOWN)
+        overwrite = messagebox.askyesnocancel(title="Keys already exist",
+                                              message="""Keys for {} targets already exist in the database:\n{}\nDatabase can't hold multible keys for the same target.\nDo you want to overwrite the existing keys? Choose No to skip these keys.""".format(len(conflicts),shown),
+                                              icon = "question")
+        if overwrite is None:
+            return None
+        return "overwrite" if overwrite else "skip"
+
+    def search_keys(self,text):
+        """
+        Keys whose target contains text, case-insensitive. Uses the trigram index of the key store.
+        """
+        return self.keys.search(text)
+
+    def _process_values(self,values,processor):
+        """
+        Processor must be one of the batch methods of Crypting, e.g. "encrypt_raw_many" or "decrypt_raw_many".
+        """
+        n_workers = os.cpu_count() or 1
+        if not self.parallel or len(values) < PARALLEL_THRESHOLD or n_workers < 2:
+            return getattr(self.crypt,processor)(values)
+
+        chunk_len = -(-len(values) // n_workers)
+        chunks = [values[n:n+chunk_len] for n in range(0,len(values),chunk_len)]
+
+        init_args = self.crypt_params
+        with ProcessPoolExecutor(max_workers=n_workers,initializer=_init_worker,initargs=init_args) as pool:
+            results = pool.map(_process_chunk,chunks,[processor]*len(chunks))
+            return [value for chunk in results for value in chunk]
+
+
+    def _read_keys(self,targets,names,keys):
+        """
+        Make KeyEntry objects from field columns. Encrypted fields are given as raw ciphertext, others as strings.
+        Targets are decrypted here in one batch, names and keys are left for KeyEntry to decrypt when read.
+        The columns are emptied while the entries are made, so the fields are not held twice.
+        """
+        if self.mode == 0 or self.mode == 1:
+            plain_targets = targets
+        elif self.mode == 2:
+            plain_targets = self._process_values(targets,"decrypt_raw_many")
         else:
             raise Exception("Prosessing of keys finished unsatisfactorily")
 
+        entries = []
+        for n,plain_target in enumerate(plain_targets):
+            cipher = (targets[n] if self.mode == 2 else None,names[n],keys[n])
+            targets[n] = names[n] = keys[n] = None
+            if self.mode == 0:
+                entries.append(KeyEntry(plain_target,cipher[1],cipher[2]))
+            else:
+                entries.append(KeyEntry(plain_target,cipher=cipher,crypt=self.crypt))
+        return entries
+
+
+    def _write_keys(self,entries):
+        """
+        Returns (target, name, key) of every entry, encrypted fields as raw ciphertext, others as strings.
+        Keys holding ciphertext of the current Crypting reuse it, only the dirty ones are encrypted, in one batch.
+        The new ciphertext is kept on the entries, so the next save can reuse it too.
+        """
+        encrypted = [field in encrypted_fields(self.mode) for field in FIELDS]
+        no_cipher = (None,None,None)
+
+        def reusable(entry):
+            return encrypted[1] and entry.cached(self.crypt)
+
+        # Decrypt in one batch the keys whose name or key has to be written from plaintext
+        decrypt_entries([entry for entry in entries if not reusable(entry)])
+
+        rows = []
+        dirty = []
+        pending_rows = []
+        pending_values = []
+        for entry in entries:
+            cipher = entry.cipher if reusable(entry) else no_cipher
+            row = [None,None,None]
+            for n,field in enumerate(FIELDS):
+                if not encrypted[n]:
+                    row[n] = getattr(entry,field)
+                elif cipher[n] is not None:
+                    row[n] = cipher[n]
+                else:
+                    pending_rows.append((row,n))
+                    pending_values.append(getattr(entry,field))
+            if pending_rows and pending_rows[-1][0] is row:
+                dirty.append((entry,row))
+            rows.append(row)
+
+        for (row,n),value in zip(pending_rows,self._process_values(pending_values,"encrypt_raw_many")):
+            row[n] = value
+
+        if encrypted[1]:
+            for entry,row in dirty:
+                entry.set_cipher((row[0] if encrypted[0] else None,row[1],row[2]),self.crypt)
+        return rows
+
+    def _read_header(self,header):
+        self.codec = header["codec"]
+        self.char1 = header["char1"]
+        self.char2 = header["char2"]
+        self.mode =  header["mode"]
+        self.cipher = header.get("cipher","ecb")
+        self.snapshot = header.get("snapshot")
+        # Engines of an earlier file are not reused
+        self.crypt_params = None
+        self.data_key = None
+        self.update_crypting()
+        self._check_passphrase(header)
+        if header.get("data_key"):
+            self.data_key = self.key_crypt.unwrap_key(bytes.fromhex(header["data_key"]))
+            self.update_crypting()
+
+    def _write_header(self):
+        header = {"codec": self.codec,
+                  "char1": self.char1,
+                  "char2": self.char2,
+                  "mode" : self.mode,
+                  "cipher" : self.cipher,
+                  "snapshot" : self.snapshot
+                  }
+        header.update(self.key_header())
+        return header
+
     # dict to data transform
     def read_dict(self,data_dict):
-        self.codec = data_dict["codec"]
-        self.char1 = data_dict["char1"]
-        self.char2 = data_dict["char2"]
-        self.mode =  data_dict["mode"]
-        self.update_crypting()
+        """
+        Read header and keys of data_dict, the dict is left as it is.
+        """
+        self._read_header(data_dict)
+        self.keys = self._dicts_to_keys(list(data_dict["keys"]))
+
+    def _dicts_to_keys(self,rows):
+        """
+        Rows are taken out of the list one by one, so the hex strings are freed while the columns grow.
+        The list is empty afterwards.
+        """
+        encrypted = [field in encrypted_fields(self.mode) for field in FIELDS]
 
-        self.keys = self._process_keys(keys = data_dict["keys"], processor = self.crypt.decrypt)
+        rows.reverse()
+        columns = ([],[],[])
+        while rows:
+            key = rows.pop()
+            for column,field,enc in zip(columns,FIELDS,encrypted):
+                column.append(bytes.fromhex(key[field]) if enc else key[field])
+        return self._read_keys(*columns)
+
+    def _iter_batches(self,rows,convert,batch_size,source=None):
+        try:
+            for batch in batches(rows,batch_size):
+                yield convert(batch)
+        finally:
+            if source is not None:
+                source.close()
 
 
     # data to dict transform
     def write_dict(self):
+        data_dict = self._write_header()
+        data_dict["keys"] = self._keys_to_dicts(self.keys)
+        return data_dict
 
-        keys = self._process_keys(keys = self.keys, processor = self.crypt.encrypt)
+    def _keys_to_dicts(self,entries):
+        encrypted = [field in encrypted_fields(self.mode) for field in FIELDS]
 
-        data_dict = {"codec": self.codec,
-                "char1": self.char1,
-                "char2": self.char2,
-                "mode" : self.mode,
-                "keys" : keys
-                }
-        return data_dict
+        keys = self._write_keys(entries)
+        for n,row in enumerate(keys):
+            keys[n] = {field: value.hex() if enc else value for field,value,enc in zip(FIELDS,row,encrypted)}
+        return keys
+
+    # JSON Lines transforms, STREAM_BATCH keys at a time
+    def iter_dicts(self,header,rows,decrypt=False):
+        """
+        Read header and yield KeyEntry objects of the key dicts in rows while rows is being read.
+        With decrypt names and keys are decrypted batch by batch before the entries are yielded.
+        Entries are not added to the database.
+        """
+        self._read_header(header)
+        for batch in batches(rows,STREAM_BATCH):
+            entries = self._dicts_to_keys(batch)
+            if decrypt:
+                decrypt_entries(entries)
+            yield from entries
+
+    def write_dicts(self):
+        """
+        Yield key dicts of write_dict one at a time.
+        """
+        for batch in batches(self.keys,STREAM_BATCH):
+            yield from self._keys_to_dicts(batch)
+
+    # binary records to data transform
+    def read_records(self,header,records):
+        self._read_header(header)
+        self.keys = self._records_to_keys(records)
+
+    def _records_to_keys(self,records):
+        """
+        Records can be any iterable of (target, name, key) bytes-like fields, they are read straight into columns.
+        """
+        encrypted = encrypted_fields(self.mode)
+        codec = self.codec
+        read_target, read_name, read_key = [bytes if field in encrypted else lambda value: str(value,codec) for field in FIELDS]
+
+        targets, names, keys = [], [], []
+        for target,name,key in records:
+            targets.append(read_target(target))
+            names.append(read_name(name))
+            keys.append(read_key(key))
+        return self._read_keys(targets,names,keys)
+
+    # data to binary records transform
+    def write_records(self,digests=True):
+        """
+        Returns (header, records, digests), digests are the target digests of the keys, None without digests.
+        """
+        encrypted = [field in encrypted_fields(self.mode) for field in FIELDS]
+
+        records = self._write_keys(self.keys)
+        for n,row in enumerate(records):
+            records[n] = tuple(value if enc else value.encode(self.codec) for value,enc in zip(row,encrypted))
+        if digests:
+            digests = [self.crypt.target_digest(key.target) for key in self.keys]
+        else:
+            digests = None
+        return self._write_header(), records, digests
 
     # File handlers
-    def read_db(self,path):
-        with open(path,"r") as file:
-            dict = json.load(file)
-        self.read_dict(dict)
+    def _path_format(self,path):
+        """
+        File format is chosen by extension, other extensions (e.g. backups) keep the format the database was read in.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension == DEFAULT_DATABASE[0][1][1:]:
+            return "json"
+        elif extension == DEFAULT_DATABASE[2][1][1:]:
+            return "binary"
+        elif extension == DEFAULT_DATABASE[3][1][1:]:
+            return "jsonl"
+        elif extension in (DEFAULT_DATABASE[4][1][1:],".sqlite"):
+            return "sqlite"
+        return self.file_format
+
+    def read_batches(self,path,batch_size=LOAD_BATCH):
+        """
+        Read the header of the database file at path and return an iterator of its keys in lists of
+        up to batch_size KeyEntry objects. Keys are read and targets decrypted one batch at a time,
+        so the first keys are ready long before the whole file is read (except for plain JSON files,
+        which are parsed whole). The iterator can be run on a worker thread.
+        Keys are not added to the store: add every batch in order with add_batch, then call end_read(path).
+        """
+        self.close_mapping()
+        source = None
+        if sqlite_db.is_sqlite_db(path):
+            source = sqlite_db.SQLiteDatabase(path)
+            header, rows, convert = source.header, source.records(), self._records_to_keys
+            self.file_format = "sqlite"
+        elif binary_db.is_binary_db(path):
+            header, rows = binary_db.iter_binary_db(path)
+            convert = self._records_to_keys
+            self.file_format = "binary"
+        elif jsonl_db.is_jsonl_db(path):
+            header, rows = jsonl_db.iter_jsonl_db(path)
+            convert = self._dicts_to_keys
+            self.file_format = "jsonl"
+        else:
+            with open(path,"r") as file:
+                header = json.load(file)
+            rows, convert = header.pop("keys"), self._dicts_to_keys
+            self.file_format = "json"
+
+        self._read_header(header)
+        self.keys = KeyStore()
+        return self._iter_batches(rows,convert,batch_size,source)
+
+    def add_batch(self,batch):
+        for entry in batch:
+            self._keys.add(entry)
+
+    def end_read(self,path):
+        """
+        Replay the journal of the file at path over the keys read and start tracking changes.
+        """
+        lines, intact = journal.read_journal(path,self.snapshot)
+        valid = list(takewhile(self._valid_op,lines))
+        self._replay(valid)
+        # Operations are applied to SQLite rows on save, a journal next to an SQLite file (e.g. after conversion)
+        # is merged by rewriting the file. A damaged journal is replayed up to the damage, the rest is dropped
+        # by rewriting the file on the next save.
+        damaged = not intact or len(valid) < len(lines)
+        self.journal_ops = None if damaged or (lines and self.file_format == "sqlite") else []
+        self.saved_state = self._file_state(path) + (self.snapshot,self.key_header())
+
+    def read_db(self,path,mapped=False):
+        self.close_mapping()
+        if binary_db.is_binary_db(path) and mapped:
+            self.mapped_db = binary_db.MappedDatabase(path)
+            self._read_header(self.mapped_db.header)
+            self.file_format = "binary"
+        elif sqlite_db.is_sqlite_db(path):
+            self.mapped_db = sqlite_db.SQLiteDatabase(path)
+            self._read_header(self.mapped_db.header)
+            self.file_format = "sqlite"
+        elif binary_db.is_binary_db(path):
+            header, records = binary_db.iter_binary_db(path)
+            self.read_records(header,records)
+            self.file_format = "binary"
+        elif jsonl_db.is_jsonl_db(path):
+            self.keys = self.iter_dicts(*jsonl_db.iter_jsonl_db(path))
+            self.file_format = "jsonl"
+        else:
+            with open(path,"r") as file:
+                dict = json.load(file)
+            # The parsed key dicts are not needed afterwards, they are freed while the keys are made
+            self._read_header(dict)
+            self.keys = self._dicts_to_keys(dict.pop("keys"))
+            self.file_format = "json"
+
+        self.end_read(path)
 
     def write_db(self,path):
-        dict = self.write_dict()
-        with open(path,"w") as file:
-            json.dump(dict,file)
+        """
+        Write the whole database to path. The file gets a new snapshot id, so journals of earlier versions are stale.
+        """
+        self.snapshot = os.urandom(8).hex()
+        file_format = self._path_format(path)
+        if file_format == "binary":
+            binary_db.write_binary_db(path,*self.write_records())
+        elif file_format == "jsonl":
+            jsonl_db.write_jsonl_db(path,self._write_header(),self.write_dicts())
+        elif file_format == "sqlite":
+            # Lookup values are the target digests when targets are encrypted (see _lookup_value), hashed only once
+            encrypted_target = "target" in encrypted_fields(self.mode)
+            header, records, digests = self.write_records(digests=encrypted_target)
+            lookups = digests if encrypted_target else [key.target for key in self.keys]
+            sqlite_db.write_sqlite_db(path,header,records,lookups)
+        else:
+            dict = self.write_dict()
+            with open(path,"w") as file:
+                json.dump(dict,file)
+
+
+    def save_db(self,path):
+        """
+        Save to path. When path is the file the database was read from or last saved to and the parameters
+        are unchanged, only the key operations made since are appended to the journal of the file,
+        or applied to the rows of an SQLite database file.
+        A changed passphrase only overwrites the wrapped data key in the header of the file.
+        Otherwise, and once the journal has grown past journal_limit bytes, the whole file is rewritten.
+        """
+        # Files written before journaling have no snapshot id, they are rewritten on the first save
+        if self.journal_ops is not None and self.saved_state is not None and self.saved_state[2] and self.saved_state[:2] == self._file_state(path) and self._rewrap(path):
+            if not self.journal_ops:
+                return
+            if sqlite_db.is_sqlite_db(path) and self._sqlite_indexed(path):
+                sqlite_db.apply_operations(path,self._write_rows(self.journal_ops))
+                self.journal_ops = []
+                return
+            # Change sets that would take the journal past its limit are not encrypted for it, the file is rewritten
+            size = journal.journal_size(path,self.saved_state[2]) + self._journal_bytes(self.journal_ops)
+            if size <= self.journal_limit:
+                journal.append_journal(path,self.saved_state[2],self._write_ops(self.journal_ops))
+                self.journal_ops = []
+                return
+
+        self.write_db(path)
+        journal.remove_journal(path)
+        self.journal_ops = []
+        self.saved_state = self._file_state(path) + (self.snapshot,self.key_header())
+
+    def _rewrap(self,path):
+        """
+        Overwrite the wrapped data key and verifier in the header of the file at path when the passphrase has changed.
+        Returns False when the file has to be rewritten instead.
+        """
+        old_values, new_values = self.saved_state[3], self.key_header()
+        if old_values == new_values:
+            return True
+        if old_values.keys() != new_values.keys():
+            return False
+
+        if sqlite_db.is_sqlite_db(path):
+            sqlite_db.update_header(path,new_values)
+        else:
+            # New values have the same length as the old ones, the header keeps its size
+            with open(path,"r+b") as file:
+                head = file.read(HEADER_SPAN)
+                positions = []
+                for name in new_values:
+                    old_value = old_values[name].encode("ascii")
+                    position = head.find(old_value)
+                    if position < 0 or head.find(old_value,position+1) >= 0:
+                        return False
+                    positions.append((position,new_values[name].encode("ascii")))
+                for position,value in positions:
+                    file.seek(position)
+                    file.write(value)
+        self.saved_state = self.saved_state[:3] + (new_values,)
+        return True
+
+    def _file_state(self,path):
+        if not os.path.exists(path):
+            return None
+        return (os.path.realpath(path),(self.crypt_params,self.mode))
+
+    # Journal operations
+    def _log(self,*operation):
+        if self.journal_ops is not None:
+            self.journal_ops.append(operation)
+
+    def _encrypt_ops(self,operations):
+        """
+        Operations with the fields encrypted like in the database file, as raw ciphertext.
+        """
+        encrypted = encrypted_fields(self.mode)
+        values = [value for op in operations for field,value in zip(OPERATIONS[op[0]],op[1:]) if field in encrypted]
+        cipher = iter(self.crypt.encrypt_raw_many(values))
+        return [(op[0],)+tuple(next(cipher) if field in encrypted else value for field,value in zip(OPERATIONS[op[0]],op[1:])) for op in operations]
+
+    def _journal_bytes(self,operations):
+        """
+        Upper estimate of the bytes the operations take as journal lines, nothing is encrypted.
+        Ciphertext is at most the field padded to whole blocks or with an 8 byte nonce, hex encoded.
+        """
+        encrypted = encrypted_fields(self.mode)
+        size = 0
+        for op in operations:
+            # Brackets, quoted operation name and newline
+            size += len(op[0]) + 5
+            for field,value in zip(OPERATIONS[op[0]],op[1:]):
+                if field in encrypted:
+                    size += 2*(len(value.encode(self.codec))+8) + 4
+                else:
+                    size += len(json.dumps(value)) + 2
+        return size
+
+    def _write_ops(self,operations):
+        """
+        Operations as journal lines, encrypted fields hex encoded.
+        """
+        encrypted = encrypted_fields(self.mode)
+        return [[op[0]]+[value.hex() if field in encrypted else value for field,value in zip(OPERATIONS[op[0]],op[1:])] for op in self._encrypt_ops(operations)]
+
+    def _write_rows(self,operations):
+        """
+        Operations as row operations of an SQLite database file, see sqlite_db.apply_operations.
+        """
+        encrypted = encrypted_fields(self.mode)
+
+        def record(values):
+            return tuple(value if field in encrypted else value.encode(self.codec) for field,value in zip(FIELDS,values))
+
+        rows = []
+        for op,cipher_op in zip(operations,self._encrypt_ops(operations)):
+            if op[0] == "add":
+                rows.append(("add",self._lookup_value(op[1]),record(cipher_op[1:])))
+            elif op[0] == "modify":
+                rows.append(("modify",self._lookup_value(op[1]),self._lookup_value(op[2]),record(cipher_op[2:])))
+            elif op[0] == "delete":
+                rows.append(("delete",self._lookup_value(op[1])))
+        return rows
+
+    def _lookup_value(self,target):
+        """
+        Indexed lookup value of target in an SQLite database file, keyed digest when targets are encrypted.
+        """
+        if "target" in encrypted_fields(self.mode):
+            return self.crypt.target_digest(target)
+        return target
+
+    def _sqlite_indexed(self,path):
+        with closing(sqlite_db.SQLiteDatabase(path)) as sqlite_file:
+            return sqlite_file.indexed
+
+    def _valid_op(self,line):
+        """
+        Journal line is a known operation with the right number of string fields, encrypted ones hex encoded.
+        """
+        if not line or not isinstance(line[0],str) or line[0] not in OPERATIONS or len(line) != len(OPERATIONS[line[0]])+1:
+            return False
+        encrypted = encrypted_fields(self.mode)
+        for field,value in zip(OPERATIONS[line[0]],line[1:]):
+            if not isinstance(value,str):
+                return False
+            if field in encrypted:
+                try:
+                    bytes.fromhex(value)
+                except ValueError:
+                    return False
+        return True
+
+    def _read_ops(self,lines):
+        encrypted = encrypted_fields(self.mode)
+        values = [bytes.fromhex(value) for line in lines for field,value in zip(OPERATIONS[line[0]],line[1:]) if field in encrypted]
+        plain = iter(self.crypt.decrypt_raw_many(values))
+        return [(line[0],)+tuple(next(plain) if field in encrypted else value for field,value in zip(OPERATIONS[line[0]],line[1:])) for line in lines]
+
+    def _replay(self,lines):
+        for operation, *values in self._read_ops(lines):
+            if operation == "add":
+                self.keys.add(KeyEntry(*values))
+            elif operation == "modify":
+                self.keys.replace(values[0],KeyEntry(*values[1:]))
+            elif operation == "delete":
+                self.keys.remove(values[0])
+
+    def release_mapping(self):
+        """
+        Read all keys of a memory-mapped or SQLite database into the store and close the file.
+        """
+        if self.mapped_db is None:
+            return
+        mapped_db = self.mapped_db
+        self.mapped_db = None
+        try:
+            journal_ops = self.journal_ops
+            self.keys = self._records_to_keys(mapped_db.records())
+            self.journal_ops = journal_ops
+        finally:
+            mapped_db.close()
+
+    def close_mapping(self):
+        if self.mapped_db is not None:
+            self.mapped_db.close()
+            self.mapped_db = None
+
+    def lookup(self,target):
+        """
+        Find key by target, returns KeyEntry or None.
+        A memory-mapped database is searched by target digest and an SQLite database by its lookup index,
+        so only the matching records are read.
+        """
+        if self.mapped_db is not None and self.mapped_db.indexed:
+            if self.file_format == "sqlite":
+                records = self.mapped_db.find_records(self._lookup_value(target))
+            else:
+                records = self.mapped_db.find_records(self.crypt.target_digest(target))
+            for key in self._records_to_keys(records):
+                if key.target == target:
+                    return key
+            return None
+
+        return self.keys.get(target)
 
 
     def make_test(self):
@@ -175,6 +871,7 @@ class KeyDatabase:
                      "char1": self.char1,
                      "char2": self.char2,
                      "mode" : self.mode,
+                     "cipher" : self.cipher,
                      "keys" : [{"target":"House","name":"Owner","key":"Key"},
                                {"target":"Stables","name":"Animal","key":"Horse"},
                                {"target":"Monkey","name":"Together","key":"Strong"},
@@ -197,7 +894,8 @@ class KeyDatabase:
                                {"target":"Doctor22","name":"Brithish","key":"Who"},
                               ]
                      }
-        self.read_dict(test_data)
+        self._read_header(test_data)
+        self.keys = [KeyEntry(key["target"],key["name"],key["key"]) for key in test_data["keys"]]
 
 
 # Datbase management functions
@@ -211,6 +909,49 @@ def save(data,path):
         json.dump(data,file)
 
 
+def convert_file(src_path,dst_path):
+    """
+    Convert database file between JSON, JSON Lines, binary and SQLite format, format is chosen by the extension of dst_path.
+    Encrypted fields are copied as they are, no passphrase is needed. The journal of the file is copied along.
+    SQLite files of mode 2 databases are written without lookup index, it needs the passphrase.
+    """
+    if binary_db.is_binary_db(src_path):
+        header, records = binary_db.read_binary_db(src_path)
+        header.pop("indexed")
+    elif sqlite_db.is_sqlite_db(src_path):
+        with closing(sqlite_db.SQLiteDatabase(src_path)) as sqlite_file:
+            header = sqlite_file.header
+            records = list(sqlite_file.records())
+        header.pop("indexed")
+    else:
+        if jsonl_db.is_jsonl_db(src_path):
+            header, keys = jsonl_db.iter_jsonl_db(src_path)
+        else:
+            header = load(src_path)
+            keys = header.pop("keys")
+        encrypted = encrypted_fields(header["mode"])
+        records = []
+        for key in keys:
+            records.append(tuple(bytes.fromhex(key[field]) if field in encrypted else key[field].encode(header["codec"]) for field in FIELDS))
+
+    extension = os.path.splitext(dst_path)[1].lower()
+    encrypted = encrypted_fields(header["mode"])
+    keys = ({field: bytes(value).hex() if field in encrypted else str(value,header["codec"]) for field,value in zip(FIELDS,record)} for record in records)
+    if extension == DEFAULT_DATABASE[2][1][1:]:
+        binary_db.write_binary_db(dst_path,header,records)
+    elif extension == DEFAULT_DATABASE[3][1][1:]:
+        jsonl_db.write_jsonl_db(dst_path,header,keys)
+    elif extension in (DEFAULT_DATABASE[4][1][1:],".sqlite"):
+        lookups = None if "target" in encrypted else [str(record[0],header["codec"]) for record in records]
+        sqlite_db.write_sqlite_db(dst_path,header,records,lookups)
+    else:
+        data = dict(header)
+        data["keys"] = list(keys)
+        save(data,dst_path)
+
+    journal.copy_journal(src_path,dst_path)
+
+
 def ask_save_path():
     database_path =  filedialog.asksaveasfilename(filetypes = DEFAULT_DATABASE, defaultextension = DEFAULT_DATABASE)
     return database_path
@@ -235,20 +976,30 @@ def create_data(master, password,database_path = "",placeholder=False):
 
     old_pw,_,_,_,pass_pad,data_pad,mode_int,database_path = result
     
-    db = KeyDatabase(passphrase = old_pw, codec="utf-8",pass_pad=pass_pad,data_pad=data_pad,mode=mode_int)
+    db = KeyDatabase(passphrase = old_pw, codec="utf-8",pass_pad=pass_pad,data_pad=data_pad,mode=mode_int,cipher="ctr")
 
     folder = os.path.dirname(database_path)
     if not os.path.exists(folder):
         os.makedirs(folder)
         
-    db.write_db(database_path)
+    db.save_db(database_path)
 
     return (db,database_path)
 
 
 
 def load_data(master,password, default=False,username=""):
+    database_path = ask_load_path(master,password,default,username)
+    if not database_path:
+        return
+    return open_data(password,database_path)
+
 
+def ask_load_path(master,password, default=False,username=""):
+    """
+    Dialog part of load_data: path of the database to load, None if cancelled.
+    A missing default database is created when the user agrees.
+    """
     if default and username:
         file_extension = DEFAULT_DATABASE[0][1][1:]
         working_dir = os.getcwd()
@@ -272,13 +1023,21 @@ def load_data(master,password, default=False,username=""):
         
     if not database_path:
         return
+    return database_path
 
-    db = KeyDatabase(passphrase = password, from_file = True,path = database_path)
+
+def open_data(password,database_path,progressive=False):
+    """
+    File part of load_data, needs no dialogs and can be run on a worker thread.
+    With progressive only the header is read, see KeyDatabase.read_batches.
+    Raises WrongPasswordError when the password does not open the database.
+    """
+    db = KeyDatabase(passphrase = password, from_file = True,path = database_path,progressive=progressive)
 
     return (db,database_path)
 
 
-def save_data(db,password,savepath = None):
+def save_data(db,password,savepath = None,use_journal = True):
     if savepath == None:
         database_path = ask_save_path()
 
@@ -290,7 +1049,10 @@ def save_data(db,password,savepath = None):
     db.passphrase = password
     db.update_crypting()
 
-    db.write_db(database_path)
+    if use_journal:
+        db.save_db(database_path)
+    else:
+        db.write_db(database_path)
 
     return (db,database_path)
 
@@ -314,10 +1076,26 @@ def get_backup_filepath(db_path,username):
 
 
 
+def ask_backup_path():
+    backup_path =  filedialog.asksaveasfilename(filetypes = [DEFAULT_DATABASE[1]], defaultextension = [DEFAULT_DATABASE[1]])
+    return backup_path
+
 def backup_data(db,password,backup_path = None):
     if backup_path == None:
-        backup_path =  filedialog.asksaveasfilename(filetypes = [DEFAULT_DATABASE[1]], defaultextension = [DEFAULT_DATABASE[1]])
+        backup_path = ask_backup_path()
         if not backup_path:
             return
 
-    save_data(db,password,savepath=backup_path)
\ No newline at end of file
+    save_data(db,password,savepath=backup_path,use_journal=False)
+
+
+def convert_data():
+    src_path = ask_open_path()
+    if not src_path:
+        return
+    dst_path = filedialog.asksaveasfilename(filetypes = [DEFAULT_DATABASE[2],DEFAULT_DATABASE[3],DEFAULT_DATABASE[4],DEFAULT_DATABASE[0]], defaultextension = DEFAULT_DATABASE[2][1][1:])
+    if not dst_path:
+        return
+
+    convert_file(src_path,dst_path)
+    return dst_path
\ No newline at end of file
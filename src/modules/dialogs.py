@@ -353,8 +353,8 @@ class DefineDatabase(simpledialog.Dialog):
             return 0
 
         for item in self.data.keys:
-            for key in item:
-                data_pad_char_check = item[key].find(data_pad)
+            for value in item.fields():
+                data_pad_char_check = value.find(data_pad)
                 if data_pad_char_check != -1:
                     messagebox.showwarning(title="Data padding character conflict.",message="Data padding character should not be used in any of the data entries. \n Please try again.",parent = self)
                     return 0
@@ -0,0 +1,206 @@
+import locale
+from modules.search import TrigramIndex
+
+
+# Slots of KeyEntry holding the cached sort key of a field
+SORT_SLOTS = {"target": "_sort_target", "name": "_sort_name"}
+
+
+class KeyEntry:
+    """
+    Single key stored in KeyDatabase.
+
+    Encrypted name and key are kept as ciphertext and decrypted together the first time
+    either of them is read. Decrypted values are cached. The ciphertext is kept with the
+    Crypting object that produced it, so unchanged entries can be written back without
+    encrypting them again. Entries compare by identity, comparing them never decrypts anything.
+    New and edited entries have no ciphertext, they are the dirty ones a save has to encrypt.
+
+    Large vaults hold one KeyEntry per key, so the entry is kept small: no instance dict,
+    and the ciphertext of all fields is joined into one bytes object split at 'target_len' and 'name_len'
+    ('target_len' is None when the target is not encrypted).
+
+    args:
+        target : str        Plaintext target
+        name : str          Plaintext name, None when given as ciphertext
+        key : str           Plaintext key, None when given as ciphertext
+        cipher : tuple      Raw ciphertext of (target, name, key), None for fields that are not encrypted
+        crypt : Crypting    Engine the ciphertext was made with
+    """
+    __slots__ = ("target","_name","_key","cipher_data","target_len","name_len","crypt","_sort_target","_sort_name")
+
+    def __init__(self,target,name=None,key=None,cipher=None,crypt=None):
+        self.target = target
+        self._name = name
+        self._key = key
+        self.set_cipher(cipher,crypt)
+        self._sort_target = self._sort_name = None
+
+    def set_cipher(self,cipher,crypt):
+        """
+        Keep ciphertext of (target, name, key) made with crypt, e.g. after the entry was written.
+        """
+        if cipher is None:
+            self.cipher_data = self.target_len = self.name_len = None
+        else:
+            target = cipher[0]
+            self.target_len = None if target is None else len(target)
+            self.cipher_data = (target or b"") + cipher[1] + cipher[2]
+            self.name_len = len(cipher[1])
+        self.crypt = crypt
+
+    def cached(self,crypt):
+        """
+        True when the entry holds name and key ciphertext made with crypt.
+        """
+        return self.crypt is crypt and self.cipher_data is not None
+
+    @property
+    def cipher(self):
+        """
+        Raw ciphertext of (target, name, key), None when the entry was made from plaintext.
+        """
+        if self.cipher_data is None:
+            return None
+        start = self.target_len or 0
+        end = start + self.name_len
+        target = None if self.target_len is None else self.cipher_data[:start]
+        return (target,self.cipher_data[start:end],self.cipher_data[end:])
+
+    @property
+    def decrypted(self):
+        return self._name is not None
+
+    def _decrypt(self):
+        self._name, self._key = self.crypt.decrypt_raw_many(self.cipher[1:])
+
+    @property
+    def name(self):
+        if self._name is None:
+            self._decrypt()
+        return self._name
+
+    @property
+    def key(self):
+        if self._key is None:
+            self._decrypt()
+        return self._key
+
+    def fields(self):
+        return (self.target,self.name,self.key)
+
+    def sort_key(self,field):
+        """
+        Casefolded, locale-aware sort key of the field. Keys of the sortable fields (SORT_SLOTS) are computed
+        on first use and cached, edits make a new KeyEntry so the cache never goes stale.
+        """
+        slot = SORT_SLOTS.get(field)
+        key = None if slot is None else getattr(self,slot)
+        if key is None:
+            key = locale.strxfrm(getattr(self,field).casefold())
+            if slot is not None:
+                setattr(self,slot,key)
+        return key
+
+    def __repr__(self):
+        if self.decrypted:
+            return "<KeyEntry - Target: {}, Name: {}, Key: {}>".format(self.target,self._name,self._key)
+        return "<KeyEntry - Target: {}, encrypted>".format(self.target)
+
+
+def decrypt_entries(entries):
+    """
+    Decrypt name and key of all given entries that are still encrypted, one batch per Crypting object.
+    """
+    pending = dict()
+    for entry in entries:
+        if not entry.decrypted:
+            pending.setdefault(id(entry.crypt),[]).append(entry)
+
+    for group in pending.values():
+        values = group[0].crypt.decrypt_raw_many([field for entry in group for field in entry.cipher[1:]])
+        for n,entry in enumerate(group):
+            entry._name = values[2*n]
+            entry._key = values[2*n+1]
+
+
+class KeyStore:
+    """
+    Insertion ordered store of KeyEntry objects indexed by target.
+
+    Entries live in numbered slots, slot numbers grow in insertion order and iteration follows them.
+    Lookup, insert, overwrite, rename and delete are all dict operations.
+    Renaming an entry keeps its slot, so it keeps its place in the order.
+
+    s = KeyStore(entries)
+    s.add(entry)                    Add entry at the end, an entry with the same target is removed first
+    s.replace(old_target,entry)     Put entry in the slot of old_target, an other entry with the new target is removed
+    s.remove(target)                Remove and return entry, None if not found
+    s.get(target)                   Entry or None
+    s.slot(target)                  Slot number of the entry or None
+    s.search(text)                  Entries whose target contains text (case-insensitive), in store order
+
+    The target search index is built on the first search and kept up to date by the operations above.
+    """
+    def __init__(self,entries=()):
+        self.slots = dict()
+        self.index = dict()
+        self.next_slot = 0
+        self.search_index = None
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        return iter(self.slots.values())
+
+    def __contains__(self,target):
+        return target in self.index
+
+    def get(self,target):
+        slot = self.index.get(target)
+        if slot is None:
+            return None
+        return self.slots[slot]
+
+    def slot(self,target):
+        return self.index.get(target)
+
+    def _link(self,slot,entry):
+        self.slots[slot] = entry
+        self.index[entry.target] = slot
+        if self.search_index is not None:
+            self.search_index.add(slot,entry.target)
+
+    def add(self,entry):
+        self.remove(entry.target)
+        self._link(self.next_slot,entry)
+        self.next_slot += 1
+
+    def replace(self,old_target,entry):
+        slot = self.index.pop(old_target,None)
+        if slot is None:
+            self.add(entry)
+            return
+        if entry.target != old_target:
+            self.remove(entry.target)
+        if self.search_index is not None:
+            self.search_index.remove(slot)
+        self._link(slot,entry)
+
+    def remove(self,target):
+        slot = self.index.pop(target,None)
+        if slot is None:
+            return None
+        if self.search_index is not None:
+            self.search_index.remove(slot)
+        return self.slots.pop(slot)
+
+    def search(self,text):
+        if self.search_index is None:
+            self.search_index = TrigramIndex()
+            for slot,entry in self.slots.items():
+                self.search_index.add(slot,entry.target)
+        return [self.slots[slot] for slot in sorted(self.search_index.search(text))]
@@ -0,0 +1,199 @@
+"""
+Bulk import of keys from CSV and JSON exports of other password managers.
+
+Rows are read one at a time (JSON exports other than JSON Lines are parsed whole) and handed over in
+batches of (target, name, key) tuples. Columns are mapped to the fields by name, nested JSON objects are
+flattened with "_" (e.g. {"login": {"username": ...}} has column login_username).
+Keys are added to the database unencrypted, they are encrypted in one batch when the database is saved.
+"""
+
+import csv
+import json
+import os
+from contextlib import nullcontext
+
+
+IMPORT_FILES = [("CSV File", "*.csv"),("JSON File", "*.json"),("JSON Lines", "*.jsonl")]
+
+FIELDS = ("target","name","key")
+
+# Rows are handed over this many at a time
+IMPORT_BATCH = 5000
+
+# Column names of the fields in exports of other password managers, in order of preference.
+# Compared case-insensitively. Files with columns target, name and key (own format) are mapped as they are.
+COLUMNS = {"target": ("url","login_uri","login_uris_uri","website","web site","title","name"),
+           "name": ("username","login_username","user name","user","login","email"),
+           "key": ("password","login_password","pass")}
+
+
+def map_columns(columns,mapping=None):
+    """
+    Returns {field: column} for the columns of a file.
+    mapping gives the column of any field by hand, other fields are found from COLUMNS.
+    A column is used for one field only.
+    """
+    mapping = dict(mapping or {})
+    by_name = {column.strip().lower(): column for column in reversed(columns)}
+    own_format = all(field in by_name for field in FIELDS)
+
+    for field in FIELDS:
+        if field in mapping:
+            continue
+        used = set(mapping.values())
+        for candidate in ((field,) if own_format else COLUMNS[field]):
+            column = by_name.get(candidate)
+            if column is not None and column not in used:
+                mapping[field] = column
+                break
+
+    missing = [field for field in FIELDS if field not in mapping]
+    if missing:
+        raise ValueError("No column for {} found. Columns of the file: {}".format(", ".join(missing),", ".join(columns)))
+    return mapping
+
+
+def _flatten(item,prefix=""):
+    row = dict()
+    for name,value in item.items():
+        name = prefix + str(name)
+        if isinstance(value,list):
+            value = value[0] if value else ""
+        if isinstance(value,dict):
+            row.update(_flatten(value,name+"_"))
+        else:
+            row[name] = "" if value is None else str(value)
+    return row
+
+
+# Keys of JSON exports that hold the list of keys
+ITEM_KEYS = ("items","keys","entries","passwords")
+
+
+def _json_items(data):
+    # Exports hold the keys as a list, at the top level, under one of ITEM_KEYS or under the only list valued key
+    if isinstance(data,list):
+        return data
+    for name in ITEM_KEYS:
+        if isinstance(data.get(name),list):
+            return data[name]
+    lists = [value for value in data.values() if isinstance(value,list)]
+    if len(lists) != 1:
+        raise ValueError("JSON file has no list of keys.")
+    return lists[0]
+
+
+def iter_rows(path,encoding="utf-8-sig"):
+    """
+    Returns (column names, iterator of (row number, row dict), file).
+    CSV files need a header row. Columns of JSON Lines files are taken from the first row.
+    Rows of CSV and JSON Lines files are read from file while iterating, the caller closes it.
+    Plain JSON files are read whole and closed here, file is then None.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in (".csv",".jsonl"):
+        # Parsed whole anyway, columns are collected from all rows
+        with open(path,"r",encoding=encoding) as file:
+            rows = [_flatten(item) for item in _json_items(json.load(file))]
+        columns = dict()
+        for row in rows:
+            columns.update(dict.fromkeys(row))
+        return list(columns), enumerate(rows,1), None
+
+    file = open(path,"r",newline="" if extension == ".csv" else None,encoding=encoding)
+    try:
+        if extension == ".csv":
+            reader = csv.DictReader(file)
+            return reader.fieldnames or [], _csv_rows(reader), file
+
+        rows = _jsonl_rows(file)
+        first = next(rows,None)
+        if first is None:
+            return [], iter(()), file
+        return list(first[1]), _chain(first,rows), file
+    except Exception:
+        file.close()
+        raise
+
+
+def _csv_rows(reader):
+    for row in reader:
+        yield reader.line_num, {column: value or "" for column,value in row.items() if column is not None}
+
+
+def _jsonl_rows(file):
+    for number,line in enumerate(file,1):
+        if line.strip():
+            yield number, _flatten(json.loads(line))
+
+
+def _chain(first,rows):
+    yield first
+    yield from rows
+
+
+def check_key(key,data_pad):
+    """
+    Reason the (target, name, key) can't be stored, None when it can.
+    The data padding character is stripped from decrypted fields, so fields must not contain it
+    (the same rule dialogs.UserEntry enforces).
+    """
+    if not key[0]:
+        return "Empty target."
+    for value in key:
+        if data_pad and data_pad in value:
+            return "Data padding character {} in a field.".format(data_pad)
+    return None
+
+
+def read_import(path,data_pad,mapping=None,batch_size=IMPORT_BATCH):
+    """
+    Yield (keys, rejected) for every batch_size rows of the file at path: keys is a list of (target, name, key),
+    rejected a list of (row number, reason) of the rows that can't be stored.
+    Nothing is encrypted and no dialog is shown, the iterator can be run on a worker thread.
+    The file is closed when the iterator is exhausted or closed, or when reading fails.
+    """
+    columns, rows, file = iter_rows(path)
+    with file or nullcontext():
+        if not columns:
+            return
+        mapping = map_columns(columns,mapping)
+        target_column, name_column, key_column = (mapping[field] for field in FIELDS)
+
+        keys = []
+        rejected = []
+        for number,row in rows:
+            key = (row.get(target_column,"").strip(),row.get(name_column,""),row.get(key_column,""))
+            reason = check_key(key,data_pad)
+            if reason is None:
+                keys.append(key)
+            else:
+                rejected.append((number,reason))
+            if len(keys) + len(rejected) >= batch_size:
+                yield keys, rejected
+                keys, rejected = [], []
+        if keys or rejected:
+            yield keys, rejected
+
+
+def add_batch(db,batch,policy,totals):
+    """
+    Add a (keys, rejected) batch of read_import to KeyDatabase db with db.add_keys.
+    policy decides about keys whose target is already in the database, see db.CONFLICT_POLICIES.
+    totals is the [number of keys added, rejected rows] of the import so far, updated in place.
+    """
+    keys, rejected = batch
+    totals[0] += db.add_keys(keys,policy) or 0
+    totals[1].extend(rejected)
+    return totals
+
+
+def import_keys(db,path,policy="skip",mapping=None,batch_size=IMPORT_BATCH):
+    """
+    Add the keys of the file at path to KeyDatabase db, batch by batch.
+    Returns (number of keys added, rejected rows as (row number, reason)).
+    """
+    totals = [0,[]]
+    for batch in read_import(path,db.char2,mapping,batch_size):
+        add_batch(db,batch,policy,totals)
+    return tuple(totals)
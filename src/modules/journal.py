@@ -0,0 +1,111 @@
+"""
+Append-only change journal of a database file.
+
+The journal is kept next to the database file (<path>.journal) and holds the key operations
+made since the file was last written in full:
+    First line:     {"snapshot": id} of the database file the operations apply to
+    Other lines:    One operation per line, e.g. ["add", target, name, key], ["modify", old_target, target, name, key]
+                    or ["delete", target]. Encrypted fields hold hex ciphertext, plaintext fields the string.
+
+Every full write of the database file gets a new snapshot id, a journal with an other id is stale.
+A journal cut short (e.g. by a crash while appending) is read up to the first line that can't be parsed.
+"""
+
+import json
+import os
+import shutil
+
+
+def journal_path(path):
+    return path + ".journal"
+
+
+def read_journal(path,snapshot):
+    """
+    Returns (operations, intact) of the journal of the database file at path.
+    Missing and stale journals have no operations. Lines are read up to the first one that is not a JSON list,
+    intact is False when such a line was found.
+    """
+    path = journal_path(path)
+    if not snapshot or not os.path.exists(path):
+        return [], True
+    with open(path,"r") as file:
+        try:
+            header = json.loads(file.readline())
+        except ValueError:
+            return [], True
+        if not isinstance(header,dict) or header.get("snapshot") != snapshot:
+            return [], True
+
+        operations = []
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                operation = json.loads(line)
+            except ValueError:
+                return operations, False
+            if not isinstance(operation,list):
+                return operations, False
+            operations.append(operation)
+        return operations, True
+
+
+def append_journal(path,snapshot,operations):
+    """
+    Append operations to the journal of the database file at path, a new journal is started when
+    there is none or the existing one is stale. Returns the size of the journal in bytes.
+    """
+    path = journal_path(path)
+    if _read_header(path).get("snapshot") != snapshot:
+        _remove(path)
+
+    with open(path,"a") as file:
+        if file.tell() == 0:
+            file.write(json.dumps({"snapshot": snapshot})+"\n")
+        for operation in operations:
+            file.write(json.dumps(operation)+"\n")
+        # Saved edits exist only in the journal until the next full write
+        file.flush()
+        os.fsync(file.fileno())
+        return file.tell()
+
+
+def journal_size(path,snapshot):
+    """
+    Size in bytes of the journal of the database file at path, 0 when there is none or it is stale.
+    """
+    path = journal_path(path)
+    if _read_header(path).get("snapshot") != snapshot:
+        return 0
+    return os.path.getsize(path)
+
+
+def _read_header(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path,"r") as file:
+        try:
+            header = json.loads(file.readline())
+        except ValueError:
+            return {}
+    return header if isinstance(header,dict) else {}
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def remove_journal(path):
+    _remove(journal_path(path))
+
+
+def copy_journal(src_path,dst_path):
+    """
+    Copy the journal of database file src_path to go with dst_path, when there is one.
+    """
+    if os.path.exists(journal_path(src_path)):
+        shutil.copyfile(journal_path(src_path),journal_path(dst_path))
+    else:
+        remove_journal(dst_path)
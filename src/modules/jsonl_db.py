@@ -0,0 +1,59 @@
+"""
+JSON Lines database container.
+
+Layout:
+    First line:     JSON object with the database parameters (codec, char1, char2, mode, cipher)
+    Other lines:    One JSON object per key with target, name and key.
+                    Encrypted fields hold hex ciphertext, plaintext fields the string.
+
+Keys are read and written one line at a time, so neither side holds the whole file in memory.
+"""
+
+import json
+
+
+# A JSON Lines header is short, longer first lines belong to a plain JSON database
+MAX_HEADER = 4096
+
+
+def is_jsonl_db(path):
+    with open(path,"r") as file:
+        line = file.readline(MAX_HEADER)
+    try:
+        header = json.loads(line)
+    except ValueError:
+        return False
+    return isinstance(header,dict) and "keys" not in header
+
+
+def write_jsonl_db(path,header,keys):
+    """
+    args:
+        header : dict       Database parameters
+        keys : iterable     Key dicts, written as they are produced
+    """
+    with open(path,"w") as file:
+        file.write(json.dumps(header)+"\n")
+        for key in keys:
+            file.write(json.dumps(key)+"\n")
+
+
+def _iter_keys(file):
+    with file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_jsonl_db(path):
+    """
+    Returns (header dict, iterator of key dicts)
+    The file stays open until the iterator is exhausted.
+    """
+    file = open(path,"r")
+    try:
+        header = json.loads(file.readline())
+    except ValueError:
+        file.close()
+        raise ValueError("Not a JSON Lines database file.")
+    return header, _iter_keys(file)
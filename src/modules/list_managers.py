@@ -2,6 +2,10 @@ import tkinter as tk
 from tkinter import ttk, simpledialog
 
 
+# Inserts and removals recorded before the item positions of VirtualList are renumbered (at least)
+MIN_SHIFTS = 32
+
+
 class ScrollableFrame(ttk.Frame):
     """
     Scrollable frame. 
@@ -32,6 +36,188 @@ class ScrollableFrame(ttk.Frame):
 
 
 
+class VirtualList(ttk.Frame):
+    """
+    Virtualized list view.
+    Row widgets are made only for the rows that fit the viewport. Scrolling rebinds
+    the same rows to other items, so the number of widgets does not depend on the
+    number of items.
+
+    args:
+        make_row : function     make_row(master,n) returns the n:th row widget.
+                                Row must have method show(item) that displays the item.
+        headers : function      headers(master) makes the header row, optional
+
+    l = VirtualList(master,make_row)
+    l.set_items(items,reset)    Show list of items, also used to reorder. With reset the list is scrolled to the top,
+                                otherwise it keeps its position.
+    l.insert_item(n,item)       Insert item at position n
+    l.append_item(item)         Add item to the end
+    l.update_item(old,new)      Show new item in place of old
+    l.remove_item(item)         Remove item
+
+    Items are found from a map of item positions, built on first use after set_items.
+    Inserts and removals are recorded as shifts instead of renumbering every later item, a position is
+    brought up to date by the shifts recorded after it. The map is renumbered once there are more shifts
+    than the square root of the number of items (at least MIN_SHIFTS).
+    After a change only the rows whose item changed are rebound.
+    """
+    def __init__(self, master, make_row, headers=None, *args, **kwargs):
+        super().__init__(master, *args, **kwargs)
+        self.make_row = make_row
+        self.items = []
+        self.positions = None
+        self.shifts = []
+        self.rows = []
+        self.first = 0
+        self.row_height = 0
+
+        if headers is not None:
+            header_area = tk.Frame(self)
+            header_area.pack(side="top",fill="x")
+            headers(header_area)
+
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.body = tk.Frame(self)
+        self.body.pack(side="left", fill="both", expand=True)
+        self.body.columnconfigure(0,weight=1)
+        self.body.bind("<Configure>",lambda e: self.fit_rows())
+
+        self.bind_all("<MouseWheel>",self.on_wheel,add="+")
+        self.bind_all("<Button-4>",self.on_wheel,add="+")
+        self.bind_all("<Button-5>",self.on_wheel,add="+")
+
+    def _add_row(self):
+        row = self.make_row(self.body,len(self.rows))
+        row.grid(row=len(self.rows),column=0,sticky="ew")
+        self.rows.append(row)
+        if not self.row_height:
+            self.body.update_idletasks()
+            self.row_height = max(row.winfo_reqheight(),1)
+
+    @property
+    def n_visible(self):
+        # Rows fully inside the viewport
+        if not self.row_height:
+            return 1
+        return max(self.body.winfo_height() // self.row_height,1)
+
+    def fit_rows(self):
+        """
+        Make or remove rows to fill the viewport, one extra row shows a partially visible item at the bottom.
+        """
+        if not self.rows:
+            self._add_row()
+        n_rows = self.n_visible + 1
+        while len(self.rows) < n_rows:
+            self._add_row()
+        while len(self.rows) > n_rows:
+            self.rows.pop().destroy()
+        self.scroll_to(self.first)
+
+    def set_items(self,items,reset=False):
+        self.items = items
+        self.positions = None
+        self.scroll_to(0 if reset else self.first)
+
+    def _renumber(self):
+        # Positions are (position, number of shifts already applied)
+        self.positions = {item: (n,0) for n,item in enumerate(self.items)}
+        self.shifts = []
+
+    def _index(self,item):
+        if self.positions is None or len(self.shifts) > max(MIN_SHIFTS,int(len(self.items)**0.5)):
+            self._renumber()
+        position = self.positions.get(item)
+        if position is None:
+            return None
+        n, applied = position
+        for at,change in self.shifts[applied:]:
+            # Inserts move the items at and after 'at', removals the ones after it
+            if n > at or (n == at and change > 0):
+                n += change
+        if n >= len(self.items) or self.items[n] is not item:
+            # Items changed behind the list's back
+            self._renumber()
+            return self._index(item) if item in self.positions else None
+        self.positions[item] = (n,len(self.shifts))
+        return n
+
+    def _shift(self,at,change):
+        if self.positions is not None:
+            self.shifts.append((at,change))
+
+    def insert_item(self,n,item):
+        n = min(max(n,0),len(self.items))
+        self.items.insert(n,item)
+        self._shift(n,1)
+        if self.positions is not None:
+            self.positions[item] = (n,len(self.shifts))
+        self.scroll_to(self.first)
+
+    def append_item(self,item):
+        self.insert_item(len(self.items),item)
+
+    def update_item(self,old,new):
+        n = self._index(old)
+        if n is None:
+            return
+        self.items[n] = new
+        if self.positions is not None:
+            del self.positions[old]
+            self.positions[new] = (n,len(self.shifts))
+        if self.first <= n < self.first + len(self.rows):
+            self.rows[n - self.first].show(new)
+
+    def remove_item(self,item):
+        n = self._index(item)
+        if n is None:
+            return
+        del self.items[n]
+        del self.positions[item]
+        self._shift(n,-1)
+        self.scroll_to(self.first)
+
+    def scroll_to(self,first):
+        last_first = max(len(self.items) - self.n_visible,0)
+        self.first = min(max(first,0),last_first)
+        self.refresh()
+
+    def refresh(self):
+        for n,row in enumerate(self.rows):
+            index = self.first + n
+            if index < len(self.items):
+                row.show(self.items[index])
+                row.grid()
+            else:
+                row.grid_remove()
+
+        if self.items:
+            self.scrollbar.set(self.first/len(self.items),min((self.first+self.n_visible)/len(self.items),1.0))
+        else:
+            self.scrollbar.set(0.0,1.0)
+
+    def yview(self,*args):
+        if args[0] == "moveto":
+            self.scroll_to(round(float(args[1])*len(self.items)))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self.n_visible
+            self.scroll_to(self.first + amount)
+
+    def on_wheel(self,event):
+        if not str(event.widget).startswith(str(self)):
+            return
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.first - 3)
+        else:
+            self.scroll_to(self.first + 3)
+
+
+
 class ItemFrame(tk.Frame):
     def __init__(self,master,name):
         super().__init__(master,name=name)          
@@ -54,34 +240,86 @@ class ItemButton(tk.Label):
         self.bind("<Button-1>",function)
         place_widget(self,ipadx=3)
 
+class ItemRow(tk.Frame):
+    """
+    Reusable list row with target, name and key fields and modify / delete buttons.
+    """
+    def __init__(self,master,n,modify,delete):
+        super().__init__(master,name=str(n))
+        self.item = None
+        self.target_entry = ItemEntry(self,text="",name="target{}".format(n))
+        self.name_entry = ItemEntry(self,text="",name="name{}".format(n))
+        self.key_entry = ItemEntry(self,text="",name="key{}".format(n))
+        self.button_modify = ItemButton(self,function=modify,text="Modify", name="modify{}".format(n))
+        self.button_delete = ItemButton(self,function=delete,text="Delete", name="delete{}".format(n))
+
+    def show(self,item):
+        # Rows only rebind when their item changed
+        if item is self.item:
+            return
+        self.item = item
+        self.target_entry.var.set(item.target)
+        self.name_entry.var.set(item.name)
+        self.key_entry.var.set(item.key)
+
 
 # Consturctors for list item elements:
-def make_headers(master):
+def make_headers(master,sort=None):
+    """
+    Make header row. If sort function is given, clicking Target or Name header calls sort("target") / sort("name").
+    Returns the header entries.
+    """
     frame = ItemFrame(master,name="headers")
     header1 = ItemEntry(frame, text="Target",name="header1",relief="flat")
     header2 = ItemEntry(frame, text="Name",name="header2",relief="flat")
     header3 = ItemEntry(frame, text="Key",name="header3",relief="flat")
 
+    if sort is not None:
+        header1.bind("<Button-1>",lambda event: sort("target"))
+        header2.bind("<Button-1>",lambda event: sort("name"))
+        header1["cursor"] = header2["cursor"] = "hand2"
+    return (header1,header2,header3)
+
+
+def sorted_position(items,item,key,reverse=False):
+    """
+    Index where item goes in items sorted by key, after any equal items.
+    """
+    item_key = key(item)
+    low, high = 0, len(items)
+    while low < high:
+        middle = (low + high) // 2
+        middle_key = key(items[middle])
+        if middle_key == item_key or (middle_key > item_key if reverse else middle_key < item_key):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def sorted_index(items,item,key,reverse=False):
+    """
+    Index of item in items sorted by key, None when it is not there. Items with an equal key are told apart by identity.
+    """
+    position = sorted_position(items,item,key,reverse)
+    item_key = key(item)
+    while position > 0 and key(items[position-1]) == item_key:
+        position -= 1
+        if items[position] is item:
+            return position
+    return None
+
 
 def place_widget(widget,side="left",**kwargs):
     widget.pack(side=side,expand=True)
 
 
 # Item operations functions
-def get_name(widget):
-    return str(widget).split(".")[-1]
-
-
-def get_item_values(event):
-    item = event.widget.master
-    id = get_name(item)         # Get name of the item frame the widget belogs to
-    target = item.nametowidget("target{}".format(id))
-    target_val = target.get()
-    name = item.nametowidget("name{}".format(id))
-    name_val = name.get()
-    key = item.nametowidget("key{}".format(id))
-    key_val = key.get()
-    return (target_val,name_val,key_val)
+def get_item(event):
+    """
+    Item shown on the row of the clicked widget.
+    """
+    return event.widget.master.item
 
 def match_string(pattern:str,data:str):
     if data.find(pattern) != -1:
@@ -92,8 +330,13 @@ def match_string(pattern:str,data:str):
 
 if __name__ == "__main__":
 
+    class Item:
+        def __init__(self,n):
+            self.target, self.name, self.key = "Target {}".format(n), "Name {}".format(n), "Key {}".format(n)
+
     app = tk.Tk()
-    frame = ScrollableFrame(app)
-    frame.pack()
+    frame = VirtualList(app,make_row=lambda master,n: ItemRow(master,n,print,print),headers=make_headers)
+    frame.pack(fill="both",expand=True)
+    frame.set_items([Item(n) for n in range(100000)])
 
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,59 @@
+class TrigramIndex:
+    """
+    Substring index over lowercased strings.
+
+    Every trigram (3 character substring) of a string maps to the ids of the strings containing it.
+    Queries of 3 or more characters intersect the postings of their trigrams, starting from the
+    smallest, and check the remaining candidates with a plain substring test. Shorter queries
+    match a large part of any database, they are answered by checking every string.
+
+    i = TrigramIndex()
+    i.add(id,text)
+    i.remove(id)
+    i.search(query)         Set of ids whose text contains the query
+    """
+    def __init__(self):
+        self.postings = dict()
+        self.texts = dict()
+
+    def __len__(self):
+        return len(self.texts)
+
+    @staticmethod
+    def _trigrams(text):
+        return {text[n:n+3] for n in range(len(text)-2)}
+
+    def add(self,id,text):
+        text = text.lower()
+        self.texts[id] = text
+        for gram in self._trigrams(text):
+            self.postings.setdefault(gram,set()).add(id)
+
+    def remove(self,id):
+        text = self.texts.pop(id,None)
+        if text is None:
+            return
+        for gram in self._trigrams(text):
+            ids = self.postings[gram]
+            ids.discard(id)
+            if not ids:
+                del self.postings[gram]
+
+    def search(self,query):
+        query = query.lower()
+        if len(query) < 3:
+            return {id for id,text in self.texts.items() if query in text}
+
+        postings = []
+        for gram in self._trigrams(query):
+            ids = self.postings.get(gram)
+            if not ids:
+                return set()
+            postings.append(ids)
+        postings.sort(key=len)
+
+        candidates = postings[0].intersection(*postings[1:])
+
+        if len(query) == 3:
+            return candidates
+        return {id for id in candidates if query in self.texts[id]}
@@ -0,0 +1,134 @@
+"""
+SQLite database container.
+
+Tables:
+    header:     name, value        Database parameters, values as JSON (codec, char1, char2, mode, cipher, indexed, ...)
+    keys:       slot, lookup, target, name, key
+                Slot (rowid) keeps the order of the keys. Encrypted fields hold raw ciphertext,
+                plaintext fields the encoded string. Lookup is the indexed search column: the plaintext
+                target in modes 0 and 1, the keyed digest of the target in mode 2.
+                Lookup is empty when "indexed" is false.
+
+Keys are read and changed row by row, only the header is read on opening.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+
+
+MAGIC = b"SQLite format 3\x00"
+
+SCHEMA = ("CREATE TABLE header (name TEXT PRIMARY KEY, value TEXT)",
+          "CREATE TABLE keys (slot INTEGER PRIMARY KEY, lookup, target BLOB, name BLOB, key BLOB)",
+          "CREATE INDEX keys_lookup ON keys (lookup)")
+
+
+def is_sqlite_db(path):
+    with open(path,"rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def write_sqlite_db(path,header,records,lookups=None):
+    """
+    Write a new database file, an existing file at path is replaced.
+    The file is built next to path under a temporary name and moved over path once committed,
+    so a failed write leaves the existing file as it was.
+
+    args:
+        header : dict       Database parameters
+        records : iterable  (target, name, key) byte strings of every entry
+        lookups : list      Lookup value of every entry. Without lookups the file is written unindexed.
+    """
+    header = dict(header,indexed=lookups is not None)
+    if lookups is None:
+        rows = ((None,)+tuple(record) for record in records)
+    else:
+        rows = ((lookup,)+tuple(record) for lookup,record in zip(lookups,records))
+
+    folder = os.path.dirname(os.path.abspath(path))
+    file, temp_path = tempfile.mkstemp(prefix=os.path.basename(path)+".",suffix=".tmp",dir=folder)
+    os.close(file)
+    try:
+        with closing(sqlite3.connect(temp_path)) as connection:
+            with connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+                connection.executemany("INSERT INTO header VALUES (?,?)",[(name,json.dumps(value)) for name,value in header.items()])
+                connection.executemany("INSERT INTO keys (lookup,target,name,key) VALUES (?,?,?,?)",rows)
+        os.replace(temp_path,path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def apply_operations(path,operations):
+    """
+    Apply key operations to the rows of an indexed database file in one transaction.
+
+    args:
+        operations : list   ("add", lookup, record), ("modify", old_lookup, lookup, record) or ("delete", lookup),
+                            records are (target, name, key) byte strings.
+                            Added keys go last, modified keys keep their slot.
+    """
+    with closing(sqlite3.connect(path)) as connection, connection:
+        for operation in operations:
+            if operation[0] == "add":
+                _, lookup, record = operation
+                connection.execute("DELETE FROM keys WHERE lookup = ?",(lookup,))
+                connection.execute("INSERT INTO keys (lookup,target,name,key) VALUES (?,?,?,?)",(lookup,)+tuple(record))
+            elif operation[0] == "modify":
+                _, old_lookup, lookup, record = operation
+                if lookup != old_lookup:
+                    connection.execute("DELETE FROM keys WHERE lookup = ?",(lookup,))
+                cursor = connection.execute("UPDATE keys SET lookup = ?, target = ?, name = ?, key = ? WHERE lookup = ?",(lookup,)+tuple(record)+(old_lookup,))
+                if cursor.rowcount == 0:
+                    connection.execute("INSERT INTO keys (lookup,target,name,key) VALUES (?,?,?,?)",(lookup,)+tuple(record))
+            elif operation[0] == "delete":
+                connection.execute("DELETE FROM keys WHERE lookup = ?",(operation[1],))
+            else:
+                raise ValueError("Unknown key operation {}.".format(operation[0]))
+
+
+def update_header(path,values):
+    """
+    Set database parameters of the file in one transaction, the keys are not touched.
+    """
+    with closing(sqlite3.connect(path)) as connection, connection:
+        connection.executemany("INSERT OR REPLACE INTO header VALUES (?,?)",[(name,json.dumps(value)) for name,value in values.items()])
+
+
+class SQLiteDatabase:
+    """
+    Read-only view of an SQLite database file.
+    Only the header is read on opening, keys are read from the file when asked for.
+
+    s = SQLiteDatabase(path)
+    s.header                Database parameters
+    len(s)                  Number of keys
+    s.records()             Iterator of (target, name, key) byte strings of all keys, in slot order
+    s.find_records(lookup)  (target, name, key) byte strings of the keys with given lookup value
+    s.close()
+    """
+    def __init__(self,path):
+        self.connection = sqlite3.connect(path)
+        self.header = {name: json.loads(value) for name,value in self.connection.execute("SELECT name, value FROM header")}
+        self.header.setdefault("indexed",False)
+        self.indexed = self.header["indexed"]
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM keys").fetchone()[0]
+
+    def records(self):
+        return self.connection.execute("SELECT target, name, key FROM keys ORDER BY slot")
+
+    def find_records(self,lookup):
+        if not self.indexed:
+            raise ValueError("SQLite database has no lookup index.")
+        return self.connection.execute("SELECT target, name, key FROM keys WHERE lookup = ? ORDER BY slot",(lookup,)).fetchall()
+
+    def close(self):
+        self.connection.close()